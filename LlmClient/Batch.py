@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from .LlmLib import LlmFactory
+from .Models import Chat, json_default
+
+
+# ----------------------------------------
+# INPUT
+# ----------------------------------------
+def read_records(path: str, column: str = "chat"):
+    """
+    Yields (index, record) for every chat of a .jsonl or .parquet file. A JSONL record is one line; a Parquet
+    record is the value of column (a JSON string or a struct). index is the line / row number.
+    """
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow is required to read Parquet input - pip install LlmClient[parquet]")
+        index = 0
+        for batch in pq.ParquetFile(path).iter_batches(columns=[column]):
+            for value in batch.column(0).to_pylist():
+                yield index, value
+                index += 1
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            if line.strip():
+                yield index, line
+
+
+def parse_record(record) -> tuple:
+    """
+    Returns (id, Chat). A record is a chat in its to_dict() form, optionally wrapped as {"id": ..., "chat": {...}};
+    an "id" key next to the chat's own keys works too. The id (or None) is copied to the output.
+    """
+    if isinstance(record, str):
+        record = json.loads(record)
+    if "chat" in record:
+        query = record["chat"]
+        query = json.loads(query) if isinstance(query, str) else query
+    else:
+        query = {key: value for key, value in record.items() if key != "id"}
+    return record.get("id"), Chat.from_dict(query)
+
+
+# ----------------------------------------
+# OUTPUT / RESUME
+# ----------------------------------------
+def shard_path(output: str, worker: int) -> str:
+    return os.path.join(output, f"part-{worker:05d}.jsonl")
+
+
+def resume_point(path: str) -> int:
+    """
+    Index of the last answer written to a shard, or -1. Shards are written in input order, so everything up to it
+    is done. A line cut short by a crash is removed.
+    """
+    if not os.path.exists(path):
+        return -1
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        # find the last complete line, reading backwards a block at a time
+        position = end
+        tail = b""
+        while position > 0:
+            step = min(65536, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+            if tail.count(b"\n") >= 2:
+                break
+        complete = tail[:tail.rfind(b"\n") + 1] if b"\n" in tail else b""
+        if len(complete) < len(tail):
+            f.truncate(position + len(complete))
+        lines = complete.splitlines()
+        if not lines:
+            return -1
+        return json.loads(lines[-1])["index"]
+
+
+# ----------------------------------------
+# WORKER
+# ----------------------------------------
+async def run_shard(options: dict, worker: int, workers: int, skip_until: int) -> dict:
+    factory = LlmFactory()
+    clients = await asyncio.gather(*[factory.create_client() for _ in range(options["sessions"])])
+    tags = options["tags"]
+    stats = {"worker": worker, "skipped": 0, "done": 0, "errors": 0, "seconds": 0.0}
+    started = time.monotonic()
+    reported = started
+    reported_done = 0
+
+    def own_records():
+        for index, record in read_records(options["input"], options["column"]):
+            if index % workers != worker:
+                continue
+            if index <= skip_until:
+                stats["skipped"] += 1
+                continue
+            yield index, record
+
+    records = own_records()
+    # answers are written in input order: requests run ahead of the oldest unwritten one by at most `concurrency`
+    pending = deque()
+    sent = 0
+    with open(shard_path(options["output"], worker), "a", encoding="utf-8") as out:
+        try:
+            while True:
+                while len(pending) < options["concurrency"]:
+                    item = next(records, None)
+                    if item is None:
+                        break
+                    index, record = item
+                    # parsing and hashing happen here, in this worker's process
+                    record_id, chat = parse_record(record)
+                    client = clients[sent % len(clients)]
+                    sent += 1
+                    pending.append((index, record_id, asyncio.create_task(client.Ask(chat, tags, options["cache_only"], options["retries"]))))
+                if not pending:
+                    break
+                index, record_id, task = pending.popleft()
+                output = await task
+                out.write(json.dumps({"index": index, "id": record_id, **asdict(output)}, default=json_default) + "\n")
+                stats["done"] += 1
+                if output.error is not None:
+                    stats["errors"] += 1
+                now = time.monotonic()
+                if now - reported >= options["report_every"]:
+                    out.flush()
+                    rate = (stats["done"] - reported_done) / (now - reported)
+                    print(f"worker {worker}: {stats['done']:,} done ({stats['errors']:,} errors, {stats['skipped']:,} resumed) - {rate:,.0f} chats/s", flush=True)
+                    reported = now
+                    reported_done = stats["done"]
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+            await asyncio.gather(*[task for _, _, task in pending], return_exceptions=True)
+            await asyncio.gather(*[client.Close() for client in clients], return_exceptions=True)
+            await factory.connection.close()
+    stats["seconds"] = time.monotonic() - started
+    return stats
+
+
+def worker_main(options: dict, worker: int, workers: int) -> dict:
+    skip_until = resume_point(shard_path(options["output"], worker))
+    return asyncio.run(run_shard(options, worker, workers, skip_until))
+
+
+# ----------------------------------------
+# COMMAND LINE
+# ----------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Ask every chat of a JSONL or Parquet file, resumably, in several worker processes.")
+    parser.add_argument("input", help=".jsonl (one chat per line) or .parquet file")
+    parser.add_argument("output", help="folder for the part-NNNNN.jsonl result shards")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    parser.add_argument("--sessions", type=int, default=2, help="sessions per worker")
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight per worker")
+    parser.add_argument("--tags", default="batch", help="comma-separated tags")
+    parser.add_argument("--column", default="chat", help="Parquet column holding the chats")
+    parser.add_argument("--cache-only", action="store_true", help="only return answers the server has cached")
+    parser.add_argument("--retries", type=int, default=-1)
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    # a resumed run must shard the input the same way
+    manifest_path = os.path.join(args.output, "manifest.json")
+    workers = args.workers
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["input"] != os.path.abspath(args.input):
+            parser.error(f"{args.output} holds results of {manifest['input']} - use another output folder")
+        if manifest["workers"] != workers:
+            print(f"resuming with {manifest['workers']} workers, as in the first run")
+            workers = manifest["workers"]
+    else:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump({"input": os.path.abspath(args.input), "workers": workers}, f)
+
+    options = {
+        "input": args.input,
+        "output": args.output,
+        "column": args.column,
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "tags": [tag for tag in args.tags.split(",") if tag],
+        "cache_only": args.cache_only,
+        "retries": args.retries,
+        "report_every": args.report_every,
+    }
+    started = time.monotonic()
+    # spawn: gRPC does not survive fork
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(worker_main, options, worker, workers) for worker in range(workers)]
+        results = []
+        failed = 0
+        for worker, future in enumerate(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failed += 1
+                print(f"worker {worker} failed: {e}", file=sys.stderr)
+    seconds = time.monotonic() - started
+    for stats in results:
+        rate = stats["done"] / stats["seconds"] if stats["seconds"] > 0 else 0
+        print(f"worker {stats['worker']}: {stats['done']:,} done, {stats['errors']:,} errors, {stats['skipped']:,} resumed - {rate:,.0f} chats/s")
+    done = sum(stats["done"] for stats in results)
+    print(f"{done:,} chats in {seconds:.1f}s ({done / seconds:,.0f} chats/s) - results in {args.output}")
+    if failed:
+        print(f"{failed} worker(s) failed - run the same command again to resume", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BlobDownloader:
+    """
+    Fetches answerReference blobs without blocking the event loop:
+        - keep-alive connections are reused across downloads
+        - at most max_concurrency downloads at a time
+        - transient failures are retried with backoff
+        - bodies are streamed into one preallocated buffer and parsed from it
+    """
+
+    def __init__(self, max_concurrency: int = 16, retries: int = 5, timeout: tuple = (10, 300), chunk_size: int = 1024 * 1024):
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llmblob")
+        self._local = threading.local()
+        self._retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+
+    def _session(self):
+        # requests sessions are not thread-safe - every download thread keeps its own keep-alive pool
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=2, max_retries=self._retry)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._local.session = session
+        return session
+
+    def fetch(self, url: str) -> bytes:
+        with self._session().get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+            length = response.headers.get("Content-Length")
+            if length is None or response.headers.get("Content-Encoding"):
+                # unknown or encoded length - let requests assemble the body
+                return response.content
+            body = bytearray(int(length))
+            view = memoryview(body)
+            pos = 0
+            for chunk in response.iter_content(self.chunk_size):
+                view[pos:pos + len(chunk)] = chunk
+                pos += len(chunk)
+            if pos != len(body):
+                raise IOError(f"Blob download truncated: got {pos} of {len(body)} bytes")
+            return body
+
+    async def download(self, url: str) -> bytes:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.fetch, url)
+
+    async def download_json(self, url: str):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: json.loads(self.fetch(url)))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -1,25 +1,61 @@
+# below this size copying the slice is cheaper than going through the memoryview
+SMALL_FIELD = 4096
+
+
 class ChunkReader:
+    """
+    Reads what ChunkWriter wrote. Large strings are decoded and bytes are returned straight from a
+    memoryview of the payload, without intermediate copies.
+    """
+
     def __init__(self, arr: bytes):
         self.arr=arr
+        self.view=memoryview(arr)
         self.offset=0
 
     def read_int(self):
+        arr = self.arr
+        offset = self.offset
+        v= arr[offset]
+        if v < 0x80:
+            # single-byte fast path (small lengths and ints)
+            self.offset = offset + 1
+            return v
         num=0
-        v= self.arr[self.offset]
-        self.offset+=1
+        offset+=1
         while v >= 0x80:
             num = (num << 7) + (v & 0x7F)
-            v = self.arr[self.offset]
-            self.offset+=1
+            v = arr[offset]
+            offset+=1
         num = (num << 7) + v
+        self.offset = offset
         if num>2**31:
             num=num-2**32
         return num
     
     def read_str(self):
-        len=self.read_int()
-        if len<0:
+        arr = self.arr
+        offset = self.offset
+        length = arr[offset]
+        if length < 0x80:
+            # one-byte length inline - most fields are short
+            offset += 1
+        else:
+            length = self.read_int()
+            if length < 0:
+                return None
+            offset = self.offset
+        end = offset + length
+        self.offset = end
+        if length < SMALL_FIELD:
+            return arr[offset:end].decode("utf-8")
+        return str(self.view[offset:end], "utf-8")
+
+    def read_bytes(self):
+        """Returns a length-prefixed raw bytes field as a zero-copy memoryview into the payload."""
+        length=self.read_int()
+        if length<0:
             return None
-        val= self.arr[self.offset : (self.offset + len)].decode("utf-8")
-        self.offset+=len
+        val= self.view[self.offset : (self.offset + length)]
+        self.offset+=length
         return val
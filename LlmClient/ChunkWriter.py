@@ -1,49 +1,57 @@
+# fields at least this large are kept as they are and copied once, by close()
+LARGE_FIELD = 64 * 1024
+
+
 class ChunkWriter:
+    """
+    Serializes ints (big-endian base-128 varints of the 32-bit two's complement value) and
+    length-prefixed strings/bytes. Small fields go into a growable buffer; large ones are referenced,
+    not copied, until close() joins everything in one pass - a large string is copied twice in total
+    (encode and join), raw bytes once. Bytes passed to write_bytes must not change before close().
+    """
     def __init__(self):
-        self.buffer_list = []
-        self.offset_list = []
-        self.length_list = []
+        self.buffer = bytearray()
+        # finished buffers and large fields, in order
+        self.parts = []
 
     def write_int(self, num: int):
         v = num & 0xFFFFFFFF
-
-        buf = bytearray(10) 
-        offset = 9 
-        length = 0
-
-        while v >= 0x80:
-            if length == 0:
-                buf[offset] = (v & 0x7F).to_bytes(1, byteorder='big')[0] 
-            else:
-                buf[offset] = ((v & 0x7F) | 0x80).to_bytes(1, byteorder='big')[0]
-            v >>= 7
-            length += 1
-            offset -= 1
-
-        if length == 0:
-            buf[9] = v.to_bytes(1, byteorder='big')[0] 
+        buf = self.buffer
+        if v < 0x80:
+            buf.append(v)
+            return
+        # most significant group first, continuation bit on every byte but the last
+        shift = (v.bit_length() - 1) // 7 * 7
+        while shift > 0:
+            buf.append(((v >> shift) & 0x7F) | 0x80)
+            shift -= 7
+        buf.append(v & 0x7F)
+
+    def _append(self, data):
+        if len(data) < LARGE_FIELD:
+            self.buffer += data
         else:
-            buf[9 - length] = (v | 0x80).to_bytes(1, byteorder='big')[0]
-
-        length += 1
-        self.buffer_list.append(buf)
-        self.offset_list.append(offset)
-        self.length_list.append(length)
+            self.parts.append(self.buffer)
+            self.parts.append(data)
+            self.buffer = bytearray()
 
     def write_str(self, val: str):
+        if val is None:
+            self.write_int(-1)
+            return
         s = val.encode()
         self.write_int(len(s))
-        self.buffer_list.append(s)
-        self.offset_list.append(0)
-        self.length_list.append(len(s))
-
-    def close(self) -> bytes:
-        total = sum(self.length_list)
-        out = bytearray(total)
-        pos = 0
+        self._append(s)
 
-        for buf, off, length in zip(self.buffer_list, self.offset_list, self.length_list):
-            out[pos:pos+length] = buf[off:off+length]
-            pos += length
+    def write_bytes(self, val):
+        """Writes a length-prefixed raw bytes field (bytes, bytearray or memoryview)."""
+        if val is None:
+            self.write_int(-1)
+            return
+        self.write_int(len(val))
+        self._append(val)
 
-        return bytes(out)
+    def close(self) -> bytes:
+        if not self.parts:
+            return bytes(self.buffer)
+        return b"".join(self.parts + [self.buffer])
@@ -0,0 +1,81 @@
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional - gzip (zlib) is always available
+    zstandard = None
+
+
+# payloads smaller than this are sent as they are - compressing them costs more than it saves
+DEFAULT_MIN_BYTES = 4096
+
+
+def available_codecs() -> list[str]:
+    """Codecs this client can encode and decode, preferred first."""
+    return (["zstd"] if zstandard is not None else []) + ["gzip"]
+
+
+def compress(codec: str, data: bytes, level: int = None) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level if level is not None else 3).compress(data)
+    if codec == "gzip":
+        # compressobj: zlib.compress only takes wbits from Python 3.11
+        packer = zlib.compressobj(level if level is not None else 6, zlib.DEFLATED, 31)
+        return packer.compress(data) + packer.flush()
+    raise ValueError(f"Unknown compression codec '{codec}'")
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Received a zstd payload but the zstandard package is not installed")
+        # max_output_size covers frames written without a content size
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=1 << 31)
+    if codec == "gzip":
+        return zlib.decompress(data, 31)
+    raise ValueError(f"Unknown compression codec '{codec}'")
+
+
+class PayloadCodec:
+    """
+    Compression settings of one session, from the environment:
+        - LLM_COMPRESSION: comma-separated codecs in order of preference, or "none" (default: all available)
+        - LLM_COMPRESSION_MIN_BYTES: smallest payload worth compressing (default 4096)
+        - LLM_COMPRESSION_LEVEL: codec level (default: zstd 3, gzip 6)
+    The codec is only used once the server has advertised it in the hello reply.
+    """
+
+    def __init__(self, codecs: list[str] = None, min_bytes: int = None, level: int = None):
+        if codecs is None:
+            setting = os.environ.get("LLM_COMPRESSION", "").strip().lower()
+            if setting == "none":
+                codecs = []
+            elif setting:
+                codecs = [c.strip() for c in setting.split(",") if c.strip()]
+            else:
+                codecs = available_codecs()
+        unknown = [c for c in codecs if c not in ("zstd", "gzip")]
+        if unknown:
+            raise ValueError(f"Unknown compression codec(s) {unknown} - expected zstd or gzip")
+        if "zstd" in codecs and zstandard is None:
+            print("LLM_COMPRESSION asks for zstd but the zstandard package is not installed - skipping it")
+            codecs = [c for c in codecs if c != "zstd"]
+        self.accepted = codecs
+        self.min_bytes = min_bytes if min_bytes is not None else int(os.environ.get("LLM_COMPRESSION_MIN_BYTES", DEFAULT_MIN_BYTES))
+        level = level if level is not None else os.environ.get("LLM_COMPRESSION_LEVEL")
+        self.level = int(level) if level is not None else None
+        # negotiated codec - None until the server agrees to one
+        self.codec = None
+
+    def negotiate(self, server_capabilities: set):
+        self.codec = next((c for c in self.accepted if c in server_capabilities), None)
+
+    def encode(self, payload: bytes):
+        """Returns (payload, encoding). Small or incompressible payloads are left as they are."""
+        if self.codec is None or len(payload) < self.min_bytes:
+            return payload, ""
+        packed = compress(self.codec, payload, self.level)
+        if len(packed) >= len(payload):
+            return payload, ""
+        return packed, self.codec
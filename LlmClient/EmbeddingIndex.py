@@ -0,0 +1,170 @@
+import os
+import json
+import asyncio
+import numpy as np
+from pathlib import Path
+from .Models import Embedding
+
+
+class EmbeddingIndex:
+    """
+    An append-only collection of embeddings on disk:
+        - vectors.f32: float32 matrix, one row per embedding, memory-mapped for queries
+        - rows.jsonl: side table with the text and cache key of every row
+    Queries scan the matrix in chunks, so corpora larger than RAM work.
+    """
+
+    def __init__(self, path: str, dim: int = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.path / "vectors.f32"
+        self._rows_path = self.path / "rows.jsonl"
+        self._header_path = self.path / "index.json"
+        if self._header_path.exists():
+            with open(self._header_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)["dim"]
+            if dim is not None and dim != self.dim:
+                raise ValueError(f"Index at {path} has dimension {self.dim}, not {dim}")
+        else:
+            self.dim = dim
+            if dim is not None:
+                self._write_header()
+        self.texts = []
+        self.keys = []
+        # byte offset after the last complete row
+        rows_end = 0
+        if self._rows_path.exists():
+            with open(self._rows_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # half-written line from an interrupted append
+                        break
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        break
+                    self.texts.append(row["text"])
+                    self.keys.append(row["key"])
+                    rows_end += len(line)
+        self._repair(rows_end)
+        self._matrix = None
+
+    def _write_header(self):
+        with open(self._header_path, 'w', encoding='utf-8') as f:
+            json.dump({"dim": self.dim}, f)
+
+    def _repair(self, rows_end: int):
+        # drop a partial last row first - later appends would otherwise be glued onto it and lost
+        if self._rows_path.exists() and os.path.getsize(self._rows_path) != rows_end:
+            os.truncate(self._rows_path, rows_end)
+        # an interrupted append can leave the two files with different row counts - keep the common prefix
+        if self.dim is None:
+            return
+        row_bytes = self.dim * 4
+        rows = os.path.getsize(self._vectors_path) // row_bytes if self._vectors_path.exists() else 0
+        count = min(rows, len(self.texts))
+        if self._vectors_path.exists() and os.path.getsize(self._vectors_path) != count * row_bytes:
+            os.truncate(self._vectors_path, count * row_bytes)
+        if len(self.texts) != count:
+            del self.texts[count:]
+            del self.keys[count:]
+            with open(self._rows_path, 'w', encoding='utf-8') as f:
+                for text, key in zip(self.texts, self.keys):
+                    f.write(json.dumps({"text": text, "key": key}) + "\n")
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def matrix(self):
+        """Memory-mapped (rows, dim) float32 matrix of all vectors."""
+        if self._matrix is None or self._matrix.shape[0] != len(self):
+            if len(self) == 0:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(len(self), self.dim))
+        return self._matrix
+
+    # ----------------------------------------
+    # APPENDING
+    # ----------------------------------------
+    def add_many(self, texts: list[str], keys: list[str], vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(texts) or len(keys) != len(texts):
+            raise ValueError("add_many expects one text, key and vector row per embedding")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._write_header()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Vectors have dimension {vectors.shape[1]}, index has {self.dim}")
+        # vectors first: a crash between the two writes leaves extra vector rows, which _repair() drops
+        with open(self._vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(self._rows_path, 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps({"text": text, "key": key}) + "\n" for text, key in zip(texts, keys)))
+        self.texts.extend(texts)
+        self.keys.extend(keys)
+
+    def add(self, text: str, key: str, vector):
+        self.add_many([text], [key], np.asarray(vector, dtype=np.float32).reshape(1, -1))
+
+    async def collect(self, client, inputs: list[Embedding], tags: list[str], concurrency: int = 32):
+        """
+        Embeds the inputs through client (cached ones are served locally) and appends them in input order.
+        Inputs whose key is already in the index are skipped. Returns the number of appended rows.
+        """
+        known = set(self.keys)
+        todo = []
+        for e in inputs:
+            if e.cache_key() not in known:
+                known.add(e.cache_key())
+                todo.append(e)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def embed(e):
+            async with semaphore:
+                return await client.Embed(e, tags, as_numpy=True)
+
+        outputs = await asyncio.gather(*[embed(e) for e in todo])
+        rows = [(e, o) for e, o in zip(todo, outputs) if o.error is None and o.answer is not None and o.answer.Embedding is not None]
+        if rows:
+            self.add_many([e.to_dict()["text"] for e, _ in rows], [e.cache_key() for e, _ in rows], np.stack([o.answer.Embedding for _, o in rows]))
+        return len(rows)
+
+    # ----------------------------------------
+    # QUERIES
+    # ----------------------------------------
+    def search(self, queries, k: int = 10, metric: str = "cosine", chunk_rows: int = 65536):
+        """
+        Top-k rows for each query vector. metric is "cosine" or "dot".
+        Returns (rows, scores), both of shape (queries, k), best match first.
+        """
+        if metric not in ("cosine", "dot"):
+            raise ValueError(f"Unknown metric '{metric}' - expected cosine or dot")
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if metric == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty((queries.shape[0], 0), dtype=np.int64), np.empty((queries.shape[0], 0), dtype=np.float32)
+        best_rows = np.empty((queries.shape[0], 0), dtype=np.int64)
+        best_scores = np.empty((queries.shape[0], 0), dtype=np.float32)
+        matrix = self.matrix
+        for start in range(0, len(self), chunk_rows):
+            chunk = np.asarray(matrix[start:start + chunk_rows])
+            scores = queries @ chunk.T
+            if metric == "cosine":
+                scores /= np.maximum(np.linalg.norm(chunk, axis=1), 1e-12)
+            rows = np.broadcast_to(np.arange(start, start + chunk.shape[0]), scores.shape)
+            # merge with the best rows so far and keep the top k
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if scores.shape[1] > k else np.argsort(-scores, axis=1)
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def search_texts(self, queries, k: int = 10, metric: str = "cosine"):
+        """Like search, but returns a list of (text, score) lists."""
+        rows, scores = self.search(queries, k, metric)
+        return [[(self.texts[r], float(s)) for r, s in zip(row, score)] for row, score in zip(rows, scores)]
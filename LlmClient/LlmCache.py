@@ -0,0 +1,475 @@
+import os
+import json
+import sqlite3
+import threading
+import argparse
+import uuid
+import struct
+import sys
+import hashlib
+from array import array
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+EMBEDDING_MAGIC = b"LLMEMB1\n"
+
+# embedding format -> (array typecode, numpy dtype, bytes per value)
+EMBEDDING_FORMATS = {
+    "float32": ("f", "<f4", 4),
+    "float16": ("e", "<f2", 2),
+}
+
+
+def _to_list(obj):
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _pack_vector(vector, embedding_format: str):
+    typecode, dtype, _ = EMBEDDING_FORMATS[embedding_format]
+    if np is not None:
+        return np.asarray(vector, dtype=dtype).tobytes()
+    if typecode == "e":
+        return struct.pack(f"<{len(vector)}e", *vector)
+    packed = array(typecode, vector)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack_vector(raw, offset: int, length: int, embedding_format: str):
+    typecode, dtype, size = EMBEDDING_FORMATS[embedding_format]
+    if np is not None:
+        # zero-copy view into the entry's buffer
+        return np.frombuffer(raw, dtype=dtype, count=length, offset=offset)
+    if typecode == "e":
+        return list(struct.unpack_from(f"<{length}e", raw, offset))
+    unpacked = array(typecode)
+    unpacked.frombytes(raw[offset:offset + length * size])
+    if sys.byteorder != "little":
+        unpacked.byteswap()
+    return unpacked.tolist()
+
+
+def encode_entry(data: dict, embedding_format: str = "json", indent: int = None):
+    """
+    Serializes a cache entry. With a binary embedding_format (float32 or float16) the embedding vector is
+    stored as raw little-endian values after a JSON header instead of as JSON numbers.
+    """
+    answer = data.get("answer")
+    vector = answer.get("Embedding") if isinstance(answer, dict) else None
+    if embedding_format == "json" or vector is None:
+        if indent:
+            return json.dumps(data, indent=indent, default=_to_list).encode("utf-8")
+        return json.dumps(data, separators=(',', ':'), default=_to_list).encode("utf-8")
+    header = dict(data)
+    header["answer"] = dict(answer)
+    header["answer"]["Embedding"] = None
+    header["EmbeddingFormat"] = embedding_format
+    header["EmbeddingLength"] = len(vector)
+    head = json.dumps(header, separators=(',', ':')).encode("utf-8")
+    # pad so the vector starts 8-byte aligned
+    head += b" " * (-(len(EMBEDDING_MAGIC) + 4 + len(head)) % 8)
+    return EMBEDDING_MAGIC + struct.pack("<I", len(head)) + head + _pack_vector(vector, embedding_format)
+
+
+def decode_entry(raw):
+    """
+    Inverse of encode_entry. Binary embeddings come back as read-only numpy arrays (or lists without numpy).
+    """
+    if isinstance(raw, (bytes, bytearray)) and raw[:len(EMBEDDING_MAGIC)] == EMBEDDING_MAGIC:
+        (length,) = struct.unpack_from("<I", raw, len(EMBEDDING_MAGIC))
+        start = len(EMBEDDING_MAGIC) + 4
+        header = json.loads(raw[start:start + length])
+        embedding_format = header.pop("EmbeddingFormat")
+        count = header.pop("EmbeddingLength")
+        header["answer"]["Embedding"] = _unpack_vector(raw, start + length, count, embedding_format)
+        return header
+    return json.loads(raw)
+
+
+class CacheStore:
+    """
+    Interface of a local response cache: maps a cache key (sha256 hex digest) to a JSON document.
+    """
+
+    # how embedding vectors are stored: json, float32 or float16
+    embedding_format = "json"
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def put(self, key: str, data: dict):
+        raise NotImplementedError
+
+    def keys(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def _is_key(name: str):
+    return len(name) == 64 and all(c in "0123456789abcdef" for c in name)
+
+
+def _write_atomic(path: Path, data: bytes):
+    # write to a temp file in the same folder and rename it into place, so readers in any
+    # process see either no file or the complete file
+    tmp = path.parent / f".{path.name}.{uuid.uuid4().hex}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class FlatDirectoryCache(CacheStore):
+    """
+    The original layout: one pretty-printed JSON file per key directly in the cache folder.
+    Embeddings stay JSON by default so older clients can keep reading a shared folder.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, key: str):
+        return self.root / key
+
+    def get(self, key: str):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return decode_entry(f.read())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # truncated file from an older non-atomic writer - treat as a miss so it gets rewritten
+            return None
+
+    def put(self, key: str, data: dict):
+        _write_atomic(self._path(key), encode_entry(data, self.embedding_format, indent=4))
+
+    def keys(self):
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.is_file() and _is_key(entry.name):
+                    yield entry.name
+
+
+class ShardedDirectoryCache(FlatDirectoryCache):
+    """
+    Fan-out layout: root/ab/cd/abcd... keeps every directory small.
+    """
+
+    embedding_format = "float32"
+
+    def _path(self, key: str):
+        return self.root / key[0:2] / key[2:4] / key
+
+    def put(self, key: str, data: dict):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(path, encode_entry(data, self.embedding_format))
+
+    def keys(self):
+        for first in sorted(os.listdir(self.root)):
+            if len(first) != 2 or not (self.root / first).is_dir():
+                continue
+            for second in sorted(os.listdir(self.root / first)):
+                folder = self.root / first / second
+                if len(second) != 2 or not folder.is_dir():
+                    continue
+                for name in os.listdir(folder):
+                    if _is_key(name):
+                        yield name
+
+
+class SqliteCache(CacheStore):
+    """
+    Single-file indexed store (SQLite in WAL mode). One connection is shared by all clients of a process;
+    several processes can read and write the same file concurrently.
+    """
+
+    embedding_format = "float32"
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID")
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM cache WHERE key=?", (key,)).fetchone()
+        if row is None:
+            return None
+        return decode_entry(row[0])
+
+    def put(self, key: str, data: dict):
+        value = encode_entry(data, self.embedding_format)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (key, value))
+
+    def put_many(self, items):
+        rows = [(key, encode_entry(data, self.embedding_format)) for key, data in items]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def keys(self):
+        with self._lock:
+            rows = self._db.execute("SELECT key FROM cache").fetchall()
+        for row in rows:
+            yield row[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class LruCache:
+    """
+    Process-local tier in front of a CacheStore. Holds decoded outputs keyed by cache key, so hits skip
+    disk and JSON parsing. Evicts least recently used entries beyond max_entries or max_bytes.
+    Returned objects are shared between callers and must be treated as read-only.
+    """
+
+    # rough per-entry overhead of the dataclasses, dict slot and key
+    ENTRY_OVERHEAD = 600
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_entries: int = 100000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def estimate_size(cls, output):
+        size = cls.ENTRY_OVERHEAD
+        answer = getattr(output, "answer", None)
+        if answer is not None:
+            if isinstance(answer.ChatAnswer, str):
+                size += len(answer.ChatAnswer)
+            if answer.Embedding is not None:
+                # arrays know their size, a list of floats costs about 32 bytes per value
+                size += getattr(answer.Embedding, "nbytes", 32 * len(answer.Embedding))
+        if isinstance(getattr(output, "error", None), str):
+            size += len(output.error)
+        return size
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, output):
+        size = self.estimate_size(output)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous[1]
+            self._entries[key] = (output, size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+SQLITE_FILE = "cache.sqlite"
+
+BACKENDS = {
+    "flat": FlatDirectoryCache,
+    "sharded": ShardedDirectoryCache,
+    "sqlite": lambda root: SqliteCache(Path(root) / SQLITE_FILE),
+}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_cache(backend: str = None, root: str = None) -> CacheStore:
+    """
+    Returns the shared cache store for a backend and folder.
+    Defaults come from LLM_CACHE_BACKEND (flat if unset) and LLM_CACHE.
+    LLM_CACHE_EMBEDDING_FORMAT (json, float32 or float16) overrides how the store writes embeddings.
+    """
+    backend = backend or os.environ.get("LLM_CACHE_BACKEND", "flat")
+    root = root or os.environ["LLM_CACHE"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown cache backend '{backend}' - expected one of {', '.join(BACKENDS)}")
+    with _stores_lock:
+        store = _stores.get((backend, root))
+        if store is None:
+            Path(root).mkdir(parents=True, exist_ok=True)
+            store = BACKENDS[backend](root)
+            embedding_format = os.environ.get("LLM_CACHE_EMBEDDING_FORMAT")
+            if embedding_format:
+                if embedding_format != "json" and embedding_format not in EMBEDDING_FORMATS:
+                    raise ValueError(f"Unknown embedding format '{embedding_format}' - expected json, {', '.join(EMBEDDING_FORMATS)}")
+                store.embedding_format = embedding_format
+            _stores[(backend, root)] = store
+        return store
+
+
+_memory_cache = None
+_executor = None
+
+
+def cache_executor():
+    """
+    Returns the bounded thread pool that runs cache reads and writes off the event loop.
+    Its size comes from LLM_CACHE_IO_THREADS (default 8).
+    """
+    global _executor
+    with _stores_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(os.environ.get("LLM_CACHE_IO_THREADS", "8")), thread_name_prefix="llmcache")
+        return _executor
+
+
+def default_memory_cache():
+    """
+    Returns the process-wide LruCache if LLM_CACHE_MEMORY_MB is set, otherwise None.
+    """
+    global _memory_cache
+    megabytes = os.environ.get("LLM_CACHE_MEMORY_MB")
+    if not megabytes:
+        return None
+    with _stores_lock:
+        if _memory_cache is None:
+            _memory_cache = LruCache(max_bytes=int(float(megabytes) * 1024 * 1024))
+        return _memory_cache
+
+
+def migrate(source: CacheStore, target: CacheStore, batch_size: int = 1000):
+    """
+    Copies every entry of source into target. Entries that fail to parse are skipped.
+    Returns the number of copied and skipped entries.
+    """
+    copied = 0
+    skipped = 0
+    batch = []
+
+    def flush():
+        if hasattr(target, "put_many"):
+            target.put_many(batch)
+        else:
+            for key, data in batch:
+                target.put(key, data)
+        batch.clear()
+
+    for key in source.keys():
+        data = source.get(key)
+        if data is None:
+            skipped += 1
+            continue
+        batch.append((key, data))
+        copied += 1
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return copied, skipped
+
+
+def rekey(store: CacheStore, requests_path: str):
+    """
+    Copies entries written by older versions under the legacy key (sha256 of the indented request JSON) to the
+    canonical key of the request. requests_path is a JSONL file with one chat or embedding per line in its
+    to_dict() form (attachments as data URLs), optionally wrapped as {"id": ..., "chat": {...}} like llmclient-batch input.
+    Returns the number of copied, already re-keyed and missing requests.
+    """
+    from .Models import canonical_hash
+    copied = present = missing = 0
+    with open(requests_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "chat" in record:
+                query = record["chat"]
+                query = json.loads(query) if isinstance(query, str) else query
+            else:
+                query = {key: value for key, value in record.items() if key != "id"}
+            key = canonical_hash(query)
+            if store.get(key) is not None:
+                present += 1
+                continue
+            data = store.get(hashlib.sha256(json.dumps(query, indent=4).encode('utf-8')).hexdigest())
+            if data is None:
+                missing += 1
+                continue
+            store.put(key, data)
+            copied += 1
+    return copied, present, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate an LLM_CACHE folder between cache backends, or re-key entries of older versions.")
+    parser.add_argument("--cache", default=os.environ.get("LLM_CACHE"), help="cache folder (default: $LLM_CACHE)")
+    parser.add_argument("--source", default="flat", choices=list(BACKENDS))
+    parser.add_argument("--target", choices=list(BACKENDS), help="backend to migrate to (default: sqlite), or to re-key (default: $LLM_CACHE_BACKEND)")
+    parser.add_argument("--rekey", metavar="REQUESTS_JSONL", help="copy the entries of these requests from their legacy to their canonical key")
+    args = parser.parse_args()
+    if args.cache is None:
+        parser.error("no cache folder given and LLM_CACHE is not set")
+    if args.rekey is not None:
+        copied, present, missing = rekey(open_cache(args.target, args.cache), args.rekey)
+        print(f"re-keyed {copied} entries ({present} already under the canonical key, {missing} not cached)")
+        return
+    args.target = args.target or "sqlite"
+    copied, skipped = migrate(open_cache(args.source, args.cache), open_cache(args.target, args.cache))
+    print(f"copied {copied} entries from {args.source} to {args.target} ({skipped} unreadable entries skipped)")
+    print(f"set LLM_CACHE_BACKEND={args.target} to use the new store")
+
+
+if __name__ == "__main__":
+    main()
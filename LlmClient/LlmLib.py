@@ -7,27 +7,276 @@ from .message_pb2_grpc import MessagesStub
 from .ChunkWriter import ChunkWriter 
 from .ChunkReader import ChunkReader 
 import os
-from .Models import Chat, Embedding
-from .LlmOutput import CachedEntry, RunMetaData, LlmOutput, LlmSimpleOutput
+from .Models import Chat, Embedding, Attachment, attachments, replace_attachments, attachment_reference, json_default
+from .LlmOutput import CachedEntry, RunMetaData, LlmOutput, LlmSimpleOutput, CacheProbe, EmbedBatchOutput
+from .BlobDownloader import BlobDownloader
+from .Compression import PayloadCodec, decompress
+from .RetryPolicy import RetryPolicy, CircuitBreaker
+from .RateLimiter import RateLimiter, default_rate_limiter, estimate_tokens
+from .SingleFlight import SingleFlight, default_single_flight
+from .LlmCache import CacheStore, LruCache, open_cache, default_memory_cache, cache_executor, np
 import json
-import requests
 import hashlib
-from pathlib import Path
-from dataclasses import asdict
+import time
+from dataclasses import asdict, replace
+from contextlib import nullcontext
+
+# size of the frames of an UploadMessage stream - well below gRPC's default 4 MB message limit
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# payloads above this size are (de)compressed on a worker thread instead of the event loop
+COMPRESSION_OFFLOAD_BYTES = 1024 * 1024
+
+# transport-level compression of the whole channel: LLM_GRPC_COMPRESSION=gzip|deflate (default: none)
+GRPC_COMPRESSION = {"gzip": grpc.Compression.Gzip, "deflate": grpc.Compression.Deflate}
+
+# gRPC waits ~1 s (growing to 2 min) before redialing a lost server - far slower than our own backoff
+CHANNEL_OPTIONS = [
+    ("grpc.initial_reconnect_backoff_ms", 100),
+    ("grpc.min_reconnect_backoff_ms", 100),
+    ("grpc.max_reconnect_backoff_ms", 10000),
+]
+
+
+def channel_options(options: dict = None) -> list:
+    """
+    gRPC channel arguments: CHANNEL_OPTIONS, then these environment settings, then options (raw gRPC names):
+        - LLM_GRPC_MAX_MESSAGE_MB: largest message sent or received (gRPC default: 4 MB received)
+        - LLM_GRPC_KEEPALIVE_MS / LLM_GRPC_KEEPALIVE_TIMEOUT_MS: ping interval and ack timeout (default: no pings)
+        - LLM_GRPC_WINDOW_BYTES: initial HTTP/2 stream window (default: gRPC's automatic sizing)
+    """
+    merged = dict(CHANNEL_OPTIONS)
+    if os.environ.get("LLM_GRPC_MAX_MESSAGE_MB"):
+        limit = int(float(os.environ["LLM_GRPC_MAX_MESSAGE_MB"]) * 1024 * 1024)
+        merged["grpc.max_send_message_length"] = limit
+        merged["grpc.max_receive_message_length"] = limit
+    if os.environ.get("LLM_GRPC_KEEPALIVE_MS"):
+        merged["grpc.keepalive_time_ms"] = int(os.environ["LLM_GRPC_KEEPALIVE_MS"])
+        # our streams are long-lived and often idle between requests
+        merged["grpc.keepalive_permit_without_calls"] = 1
+    if os.environ.get("LLM_GRPC_KEEPALIVE_TIMEOUT_MS"):
+        merged["grpc.keepalive_timeout_ms"] = int(os.environ["LLM_GRPC_KEEPALIVE_TIMEOUT_MS"])
+    if os.environ.get("LLM_GRPC_WINDOW_BYTES"):
+        merged["grpc.http2.lookahead_bytes"] = int(os.environ["LLM_GRPC_WINDOW_BYTES"])
+    merged.update(options or {})
+    return list(merged.items())
+
+# seconds between heartbeats
+HEARTBEAT_INTERVAL = 10
+
+
+class AnswerStreamBroken(ConnectionError):
+    """Raised by AskStream when the stream breaks after text was yielded; partial holds that text."""
+
+    def __init__(self, message: str, partial: str):
+        super().__init__(message)
+        self.partial = partial
+
+
+class SharedHeartbeat:
+    """
+    Keeps sessions alive over ONE heartbeat stream and ONE loop:
+        - batched: shared by all sessions of a connection to servers with the "batchheartbeat" capability,
+          which get all registered guids as one "__heartbeats__" frame every HEARTBEAT_INTERVAL seconds
+        - otherwise every session has its own, sending its "__heartbeat__" on a stream of its own
+        - sessions register their guid after the handshake and unregister when they close
+        - a broken stream is reopened on the next beat
+    """
+
+    def __init__(self, stub, batched: bool = False):
+        self.stub = stub
+        self.guids = set()
+        self.batched = batched
+        self.call = None
+        self._task = None
+        self._write_lock = asyncio.Lock()
+
+    async def register(self, guid: str):
+        self.guids.add(guid)
+        # the server learns about a session from its first heartbeat - do not wait for the next beat
+        await self._beat([guid])
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    def unregister(self, guid: str):
+        self.guids.discard(guid)
+
+    async def _open(self):
+        self.call = self.stub.BidirectionalMessage()
+        asyncio.create_task(self._drain(self.call))
+
+    @staticmethod
+    async def _drain(call):
+        # nothing useful comes back, but the replies have to be read
+        try:
+            async for msg in call:
+                pass
+        except grpc.aio.AioRpcError as e:
+            # Connection died, stop reading gracefully
+            pass
+        except Exception as e:
+            print(f"Unexpected error in heartbeat stream (retrying)")
+
+    async def _beat(self, guids):
+        async with self._write_lock:
+            try:
+                if self.call is None or self.call.done():
+                    await self._open()
+                if self.batched:
+                    writer=ChunkWriter()
+                    writer.write_int(len(guids))
+                    for guid in guids:
+                        writer.write_str(guid)
+                    await self.call.write(SimpleMessage(mtype="__heartbeats__", payload=writer.close()))
+                else:
+                    for guid in guids:
+                        await self.call.write(SimpleMessage(mtype="__heartbeat__", payload=guid.encode()))
+            except Exception:
+                # the sessions notice a dead connection on their own streams - reopen on the next beat
+                if self.call is not None:
+                    self.call.cancel()
+                self.call = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if self.guids:
+                await self._beat(sorted(self.guids))
+                continue
+            # last session is gone - let the stream go until the next one registers
+            async with self._write_lock:
+                if self.guids:
+                    continue
+                self._task = None
+                if self.call is not None:
+                    call, self.call = self.call, None
+                    try:
+                        await call.done_writing()
+                    except Exception:
+                        call.cancel()
+                return
+
+    async def close(self):
+        self.guids.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.call is not None:
+            try:
+                await self.call.done_writing()
+            except Exception:
+                self.call.cancel()
+
 
 class GrpcConnection:
     """
-    Owns ONE shared gRPC channel.
+    Owns ONE shared gRPC channel, and the batched heartbeat stream and circuit breaker shared by all its sessions.
+    options are extra gRPC channel arguments (see channel_options); a ConnectionPool passes in the
+    blob downloader shared by its channels.
     """
-    def __init__(self):
+    def __init__(self, options: dict = None, blobs: BlobDownloader = None):
+        compression = os.environ.get("LLM_GRPC_COMPRESSION", "none").lower()
+        if compression != "none" and compression not in GRPC_COMPRESSION:
+            raise ValueError(f"Unknown LLM_GRPC_COMPRESSION '{compression}' - expected gzip, deflate or none")
         self.channel = grpc.aio.secure_channel(
                     os.environ["LLM_SERVER_URL"],
-                        grpc.ssl_channel_credentials()
+                        grpc.ssl_channel_credentials(),
+                        options=channel_options(options),
+                        compression=GRPC_COMPRESSION.get(compression)
                 )
         self.stub = MessagesStub(self.channel)
+        # attachment digest -> upload task; every attachment is uploaded once per channel (a balancer may
+        # send channels of a pool to different servers)
+        self.attachments = {}
+        # shared pool for answerReference downloads
+        self._owns_blobs = blobs is None
+        self.blobs = blobs if blobs is not None else BlobDownloader()
+        # only used by sessions on servers with the "batchheartbeat" capability
+        self.heartbeat = SharedHeartbeat(self.stub, batched=True)
+        # guids of the sessions on this channel
+        self.sessions = set()
+        # opens while the server cannot be reached, so sessions stop reconnecting in lockstep
+        self.breaker = CircuitBreaker()
+        # sessions in the middle of their handshake - they count towards the load before they register
+        self.connecting = 0
+
+    def acquire(self):
+        # sessions ask their connection source for a channel; a single connection always answers itself
+        return self
+
+    @property
+    def load(self) -> int:
+        return len(self.sessions) + self.connecting
 
     async def close(self):
+        await self.heartbeat.close()
         await self.channel.close()
+        if self._owns_blobs:
+            self.blobs.close()
+
+
+class ConnectionPool:
+    """
+    K GrpcConnections to the same server, each with its own TCP connection, so sessions are not limited
+    to one HTTP/2 connection's concurrent streams and bandwidth:
+        - acquire() hands out the least-loaded healthy channel (or the next one, with strategy="round-robin")
+        - channels that were shut down, or whose circuit is open while others work, are replaced
+        - blob downloads are shared by all channels
+    Can be used wherever a GrpcConnection is expected by LlmClient.
+    """
+
+    def __init__(self, size: int, options: dict = None, strategy: str = "least-loaded"):
+        if strategy not in ("least-loaded", "round-robin"):
+            raise ValueError(f"Unknown strategy '{strategy}' - expected least-loaded or round-robin")
+        self.strategy = strategy
+        # without a local subchannel pool, channels with the same target share one TCP connection
+        self.options = {"grpc.use_local_subchannel_pool": 1, **(options or {})}
+        self.blobs = BlobDownloader()
+        self.connections = [self._open() for _ in range(size)]
+        self._next = 0
+        self._retiring = set()
+
+    def _open(self) -> GrpcConnection:
+        return GrpcConnection(self.options, self.blobs)
+
+    def _dead(self, connection: GrpcConnection) -> bool:
+        if connection.channel.get_state(try_to_connect=False) == grpc.ChannelConnectivity.SHUTDOWN:
+            return True
+        # an open circuit on one channel while another one works points at the channel, not the server
+        return connection.breaker.state == "open" and any(c.breaker.state == "closed" for c in self.connections)
+
+    def acquire(self) -> GrpcConnection:
+        for i, connection in enumerate(self.connections):
+            if self._dead(connection):
+                print(f"Replacing broken channel {i}")
+                self.connections[i] = self._open()
+                self._retire(connection)
+        healthy = [c for c in self.connections if c.breaker.state == "closed"] or self.connections
+        if self.strategy == "round-robin":
+            self._next += 1
+            return healthy[(self._next - 1) % len(healthy)]
+        return min(healthy, key=lambda c: c.load)
+
+    def _retire(self, connection: GrpcConnection):
+        # sessions still on the old channel are broken anyway - they reconnect through acquire()
+        async def close_when_idle():
+            for _ in range(60):
+                if not connection.sessions:
+                    break
+                await asyncio.sleep(1)
+            await connection.close()
+        task = asyncio.create_task(close_when_idle())
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    async def close(self):
+        for task in list(self._retiring):
+            task.cancel()
+        await asyncio.gather(*self._retiring, return_exceptions=True)
+        await asyncio.gather(*[c.close() for c in self.connections], return_exceptions=True)
+        self.blobs.close()
 
 
 
@@ -36,7 +285,9 @@ class BidirectionalClient:
     A single streaming message client that:
         - connects automatically when created
         - manages its own streams
-        - has its own heartbeat
+        - is kept alive by the heartbeat shared by all sessions of its connection, or by its own
+          on servers without the "batchheartbeat" capability
+        - matches replies to requests by request id so many requests can be in flight
     """
 
 
@@ -50,27 +301,52 @@ class BidirectionalClient:
         self.is_connected = False
 
         self.call = None
-        self.heartbeat_call = None
-
-        self._msg_future = None
-        self._heartbeat_future = None
+        self.heartbeat = None
 
-        self._heartbeat_task = None
+        # pending requests keyed by request id - replies are routed by the id the server echoes back
+        self._pending = {}
+        self._next_id = 0
+        # servers that do not echo request ids get one request at a time
+        self.multiplexed = False
+        # optional features advertised by the server in the hello reply
+        self.capabilities = set()
+        # payload compression, agreed on in the hello handshake
+        self.codec = PayloadCodec()
+        self._send_lock = asyncio.Lock()
+        # grpc allows only one pending write per stream
+        self._write_lock = asyncio.Lock()
 
     # ----------------------------------------
     # FACTORY METHOD (async init)
     # ----------------------------------------
     @classmethod
-    async def create(cls, engineType: str, connection : GrpcConnection):
+    async def create(cls, engineType: str, connection, policy : RetryPolicy = None):
+        # connection is a GrpcConnection or a ConnectionPool - every attempt asks it for a channel
+        # retries with backoff until connected, or until a bounded policy gives up
+        policy = policy if policy is not None else RetryPolicy()
+        started = time.monotonic()
+        attempt = 0
         while True:
+            conn = connection.acquire()
+            await conn.breaker.acquire(policy.bounded)
+            self = cls(engineType, conn)
+            conn.connecting += 1
             try:
-                self = cls(engineType, connection)
                 await self._connect()
-                break
+                error = None
             except Exception as e:
-                print(f"Error during connection - retrying...")
-                await asyncio.sleep(5)
-        return self
+                error = e
+            finally:
+                conn.connecting -= 1
+            if error is None:
+                conn.breaker.record_success()
+                return self
+            conn.breaker.record_failure()
+            await self.close()
+            attempt += 1
+            policy.check(attempt, started, error)
+            print(f"Error during connection - retrying...")
+            await asyncio.sleep(policy.delay(attempt))
 
     # ----------------------------------------
     # STREAM READERS (FIXED)
@@ -78,27 +354,50 @@ class BidirectionalClient:
     async def _read_call_stream(self):
         try:
             async for msg in self.call:
-                if self._msg_future and not self._msg_future.done():
-                    self._msg_future.set_result(msg)
+                if msg.encoding:
+                    msg = await self.decode_message(msg)
+                if msg.id in self._pending:
+                    future = self._pending.pop(msg.id)
+                elif self._pending and not self.multiplexed:
+                    # server did not echo the id: replies arrive in request order
+                    future = self._pending.pop(next(iter(self._pending)))
+                else:
+                    # late reply to a request whose caller gave up - it belongs to nobody else
+                    continue
+                if not future.done():
+                    future.set_result(msg)
         except grpc.aio.AioRpcError as e:
             # Connection died, stop reading gracefully
             # This prevents "Task exception was never retrieved"
             # We mark as disconnected so sends will fail and trigger retry logic
             self.is_connected = False
+        except asyncio.CancelledError:
+            # the call was cancelled - the session is as dead as after a lost connection
+            self.is_connected = False
         except Exception as e:
             print(f"Unexpected error in call stream (retrying)")
             self.is_connected = False
+        # stream is gone - nobody is going to answer the pending requests
+        self._fail_pending(ConnectionError("call stream closed"))
 
-    async def _read_heartbeat_stream(self):
+    async def decode_message(self, msg):
         try:
-            async for msg in self.heartbeat_call:
-                if self._heartbeat_future and not self._heartbeat_future.done():
-                    self._heartbeat_future.set_result(msg)
-        except grpc.aio.AioRpcError as e:
-            # Connection died, stop reading gracefully
-            pass 
+            if len(msg.payload) >= COMPRESSION_OFFLOAD_BYTES:
+                payload = await asyncio.to_thread(decompress, msg.encoding, msg.payload)
+            else:
+                payload = decompress(msg.encoding, msg.payload)
         except Exception as e:
-            print(f"Unexpected error in heartbeat stream (retrying)")
+            # hand the raw message on - the caller fails to parse it and retries
+            print(f"Could not decompress {msg.encoding} reply: {e}")
+            return msg
+        return SimpleMessage(mtype=msg.mtype, payload=payload, id=msg.id)
+
+    def _fail_pending(self, error: Exception):
+        pending = self._pending
+        self._pending = {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
 
     # ----------------------------------------
     # MAIN CONNECT LOGIC
@@ -107,26 +406,31 @@ class BidirectionalClient:
         if self.is_connected:
             return
 
-        # open two independent streaming RPCs
+        # open the streaming RPC - heartbeats go over a stream of their own
         self.call = self.stub.BidirectionalMessage()
-        self.heartbeat_call = self.stub.BidirectionalMessage()
 
-        # start background readers
+        # start background reader
         asyncio.create_task(self._read_call_stream())
-        asyncio.create_task(self._read_heartbeat_stream())
 
         # handshake
-        hello = SimpleMessage(mtype=self.engineType, payload=self.guid.encode())
+        # the hello lists the codecs we can decode; the server answers with the ones it supports
+        hello = SimpleMessage(mtype=self.engineType, payload=self.guid.encode(), encoding=",".join(self.codec.accepted))
         res = await asyncio.wait_for(self.send_receive(hello), timeout=10)        
 
         self.from_scratch = (res.mtype == "fresh")
+        # a server that echoes the request id can answer many requests concurrently
+        self.multiplexed = (res.id == hello.id)
+        self.capabilities = self._parse_capabilities(res.payload)
+        self.codec.negotiate(self.capabilities)
         print("session:", "first-time" if self.from_scratch else "reused")
 
-        # start heartbeat
-        await self.heartbeat_call.write(
-            SimpleMessage(mtype="__heartbeat__", payload=self.guid.encode())
-        )
-        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        # start heartbeat - only servers that advertise it accept the beats of many sessions on one stream
+        if "batchheartbeat" in self.capabilities:
+            self.heartbeat = self.conn.heartbeat
+        else:
+            self.heartbeat = SharedHeartbeat(self.stub)
+        self.conn.sessions.add(self.guid)
+        await self.heartbeat.register(self.guid)
 
         self.is_connected = True
 
@@ -135,47 +439,90 @@ class BidirectionalClient:
         await self.send_receive(SimpleMessage(mtype="__initengine__", payload=writer.close()))
 
 
-    # ----------------------------------------
-    # HEARTBEAT LOOP (FIXED)
-    # ----------------------------------------
-    async def _heartbeat_loop(self):
+    @staticmethod
+    def _parse_capabilities(payload: bytes):
+        # servers that know about capabilities reply with {"capabilities": [...]}, older ones send nothing useful
         try:
-            while True:
-                if not self.is_connected:
-                    break
-                await self.heartbeat_call.write(
-                    SimpleMessage(mtype="__heartbeat__", payload=self.guid.encode())
-                )
-                await asyncio.sleep(10)
-        except Exception:
-            # If writing fails (connection lost), stop the loop
-            self.is_connected = False
+            data = json.loads(payload.decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            return set()
+        if isinstance(data, dict) and isinstance(data.get("capabilities"), list):
+            return set(data["capabilities"])
+        return set()
 
     # ----------------------------------------
     # SEND/RECEIVE HELPERS
     # ----------------------------------------
     async def send_receive(self, message):
-        loop = asyncio.get_running_loop()
-        self._msg_future = loop.create_future()
+        if self.multiplexed:
+            return await self._send_receive(message)
+        async with self._send_lock:
+            return await self._send_receive(message)
 
-        await self.call.write(message)
-        return await self._msg_future
+    async def _send_receive(self, message):
+        self._next_id += 1
+        message.id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message.id] = future
+        try:
+            wire = await self.encode_message(message)
+            async with self._write_lock:
+                if self.call.done():
+                    # the stream ended before the reader noticed
+                    self.is_connected = False
+                    raise ConnectionError("call stream closed")
+                await self.call.write(wire)
+            return await future
+        finally:
+            self._pending.pop(message.id, None)
+            if future.done() and not future.cancelled():
+                # the stream may have failed the future while the write was still pending
+                future.exception()
+            elif not self.multiplexed and self.is_connected:
+                # the caller gave up: without ids its late reply would be taken for the next request's
+                self.is_connected = False
 
 
+    async def encode_message(self, message):
+        # the caller's message stays uncompressed: a retry may go to a session with other codecs
+        if self.codec.codec is None or len(message.payload) < self.codec.min_bytes:
+            return message
+        if len(message.payload) >= COMPRESSION_OFFLOAD_BYTES:
+            payload, encoding = await asyncio.to_thread(self.codec.encode, message.payload)
+        else:
+            payload, encoding = self.codec.encode(message.payload)
+        if not encoding:
+            return message
+        return SimpleMessage(mtype=message.mtype, payload=payload, id=message.id, encoding=encoding)
+
+    async def upload(self, mtype: str, header: bytes, data):
+        """
+        Sends a header frame followed by the data in chunks over the UploadMessage stream.
+        data is bytes or an iterable of byte pieces; pieces are pulled on a worker thread only as
+        fast as gRPC sends them, so a lazily read file is never held in memory.
+        """
+        pieces = iter([data] if isinstance(data, (bytes, bytearray, memoryview)) else data)
+        async def frames():
+            yield SimpleMessage(mtype=mtype, payload=header)
+            while (piece := await asyncio.to_thread(next, pieces, None)) is not None:
+                view = memoryview(piece)
+                for start in range(0, len(view), UPLOAD_CHUNK_SIZE):
+                    yield SimpleMessage(mtype="__chunk__", payload=bytes(view[start:start + UPLOAD_CHUNK_SIZE]))
+        return await self.stub.UploadMessage(frames())
 
     async def close(self):
         """
         Gracefully shuts down the streams.
         """
         self.is_connected = False
+        self._fail_pending(ConnectionError("client closed"))
 
-        # 1. Stop the heartbeat task first so we don't try to write to a closing stream
-        if self._heartbeat_task:
-            self._heartbeat_task.cancel()
-            try:
-                await self._heartbeat_task
-            except asyncio.CancelledError:
-                pass
+        # 1. Stop the heartbeats for this session
+        self.conn.sessions.discard(self.guid)
+        if self.heartbeat is self.conn.heartbeat:
+            self.conn.heartbeat.unregister(self.guid)
+        elif self.heartbeat is not None:
+            await self.heartbeat.close()
 
         # 2. Gracefully close the Main Call
         if self.call:
@@ -188,31 +535,199 @@ class BidirectionalClient:
                 # In that case, we fall back to a hard cancel.
                 self.call.cancel()
 
-        # 3. Gracefully close the Heartbeat Call
-        if self.heartbeat_call:
-            try:
-                await self.heartbeat_call.done_writing()
-            except Exception:
-                self.heartbeat_call.cancel()
-
 
 class LlmClient:
 
-    def __init__(self, connection : GrpcConnection):
+    def __init__(self, connection, cache : CacheStore = None, memory_cache : LruCache = None, retry_policy : RetryPolicy = None, rate_limiter : RateLimiter = None,
+                 single_flight : SingleFlight = None):
+        # connection is a GrpcConnection or a ConnectionPool
         self.connection = connection
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        # optional per-model budgets and adaptive concurrency for requests that reach the server
+        self.rate_limiter = rate_limiter
+        # identical requests in flight at the same time are sent once (None: coalescing is off)
+        self.single_flight = single_flight if single_flight is not None else default_single_flight()
         self.client = None # Initialize to None
+        self.cache = cache if cache is not None else open_cache()
+        self.memory_cache = memory_cache if memory_cache is not None else default_memory_cache()
+        # opt-in: also look up entries stored under the pre-canonical key (sha256 of the indented request JSON);
+        # re-keying a cache once with python -m LlmClient.LlmCache --rekey avoids the cost on every miss
+        self.legacy_keys = os.environ.get("LLM_CACHE_LEGACY_KEYS", "0") == "1"
+        # requests at least this large go over UploadMessage on servers with the "uploadrequests" capability
+        self.upload_threshold = int(os.environ.get("LLM_UPLOAD_THRESHOLD_BYTES", 3 * 1024 * 1024))
+        self._connect_lock = asyncio.Lock()
 
     async def connect(self):
         # CLEANUP: If a client exists, close it before creating a new one
         if self.client is not None:
             await self.client.close()
             
-        self.client = await BidirectionalClient.create("llm",self.connection)
-    
+        self.client = await BidirectionalClient.create("llm",self.connection,self.retry_policy)
+
+    async def reconnect(self, broken: BidirectionalClient):
+        # many in-flight requests fail together - only the first one replaces the session
+        async with self._connect_lock:
+            if self.client is broken:
+                # the server may have restarted and lost its attachments
+                broken.conn.attachments.clear()
+                await self.connect()
+
+    def schedule(self, model : str, prompt_tokens : int, requests : int = 1):
+        # "async with self.schedule(...) as usage": usage collects the outputs the rate limiter learns from
+        if self.rate_limiter is None:
+            return nullcontext([])
+        return self.rate_limiter.slot(model, prompt_tokens, requests)
+
+    async def coalesce(self, key, work):
+        # concurrent callers of the same key share one run of work()
+        if self.single_flight is None:
+            return await work()
+        return await self.single_flight.do(key, work)
+
+    @staticmethod
+    def session_lost(client: BidirectionalClient, error: Exception) -> bool:
+        # replacing a session fails every other request in flight on it - only do it when its stream is dead
+        return not client.is_connected or isinstance(error, (ConnectionError, grpc.aio.AioRpcError))
+
+    async def recover(self, broken: BidirectionalClient, attempt: int, error: Exception):
+        if self.client is not broken:
+            # another request already replaced the session - replay on it right away
+            return
+        if self.session_lost(broken, error):
+            # make a new connection
+            # The connect() method now handles closing the old broken client
+            await self.reconnect(broken)
+        # a timeout or a bad reply is retried on the same session
+        await asyncio.sleep(self.retry_policy.delay(attempt))
+
+    async def _upload_attachment(self, client : BidirectionalClient, attachment: Attachment):
+        writer=ChunkWriter()
+        writer.write_str(client.guid)
+        writer.write_str(attachment.digest.hex())
+        writer.write_str(attachment.mimeType)
+        writer.write_int(attachment.size)
+        response = await client.upload("__attachment__", writer.close(), attachment.chunks(UPLOAD_CHUNK_SIZE))
+        if response.mtype != "ok":
+            raise Exception(f"Attachment upload failed: {ChunkReader(response.payload).read_str()}")
+
+    async def upload_attachments(self, client : BidirectionalClient, query: dict):
+        """
+        Makes sure every attachment of the query is stored on the server of client (each is uploaded once per
+        connection) and returns the query JSON with attachments replaced by references to their content hash.
+        """
+        tasks = []
+        for attachment in attachments(query):
+            key = attachment.digest.hex()
+            task = client.conn.attachments.get(key)
+            if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+                task = asyncio.ensure_future(self._upload_attachment(client, attachment))
+                client.conn.attachments[key] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        return json.dumps(replace_attachments(query, attachment_reference), indent=4)
+
+    async def encode_ask(self, chat : Chat, tags : list[str], cache_only : bool, retries: int, chatJSON : str = None):
+        """
+        Builds the ask message. Attachments are sent, depending on what the server supports:
+            - "attachments": uploaded once per server and referenced by content hash
+            - "uploadrequests": requests of upload_threshold bytes or more are streamed over UploadMessage
+              in the askbinary layout, attachments read lazily; the ask only carries the server's handle
+            - "binaryattachments": as raw length-prefixed sections after the chat (mtype askbinary)
+            - otherwise inline as base64 data URLs in the chat JSON (chatJSON, if already built)
+        Returns a SimpleMessage or, for uploaded requests and attachments, an async callable that uploads them
+        for the session the request is sent on and returns its message (see SendSurely).
+        """
+        query = chat.query
+        capabilities = self.client.capabilities
+        sections = []
+        binaryJSON = None
+
+        def header(requestJSON):
+            writer=ChunkWriter()
+            writer.write_str(requestJSON)
+            writer.write_str(json.dumps(tags))
+            if cache_only:
+                writer.write_int(1)
+            else:
+                writer.write_int(0)
+            writer.write_int(retries)
+            return writer
+
+        has_attachments = any(True for _ in attachments(query))
+        if has_attachments and "attachments" in capabilities:
+            async def upload(client):
+                # a replay after a reconnect may go to a server (or channel) that does not have the attachments yet
+                requestJSON = None
+                if "attachments" in client.capabilities:
+                    try:
+                        requestJSON = await self.upload_attachments(client, query)
+                    except Exception as e:
+                        print(f"Attachment upload failed - sending attachments inline: {e}")
+                if requestJSON is None:
+                    requestJSON = chatJSON if chatJSON is not None else json.dumps(query, indent=4, default=json_default)
+                writer = header(requestJSON)
+                if "uploadrequests" in client.capabilities and len(requestJSON) >= self.upload_threshold:
+                    writer.write_int(0)
+                    return await self.upload_request(client, "askbinary", writer.close(), [])
+                return SimpleMessage(mtype="ask", payload=writer.close())
+            return upload
+        if has_attachments and ("binaryattachments" in capabilities or "uploadrequests" in capabilities):
+            positions = {}
+            def placeholder(attachment):
+                if attachment.digest not in positions:
+                    positions[attachment.digest] = len(sections)
+                    sections.append(attachment)
+                return f"attachment:section:{positions[attachment.digest]}"
+            binaryJSON = json.dumps(replace_attachments(query, placeholder), indent=4)
+        if binaryJSON is None and chatJSON is None:
+            chatJSON = json.dumps(query, indent=4, default=json_default)
+        large = "uploadrequests" in capabilities and len(binaryJSON or chatJSON) + sum(a.size for a in sections) >= self.upload_threshold
+        if binaryJSON is not None and not large and "binaryattachments" not in capabilities:
+            # small request for a server that only takes binary sections in uploads
+            binaryJSON = None
+            sections = []
+            if chatJSON is None:
+                chatJSON = json.dumps(query, indent=4, default=json_default)
+        writer = header(binaryJSON or chatJSON)
+        if large:
+            writer.write_int(len(sections))
+            prefix = writer.close()
+            async def upload(client):
+                return await self.upload_request(client, "askbinary", prefix, sections)
+            return upload
+        if binaryJSON is not None:
+            writer.write_int(len(sections))
+            for attachment in sections:
+                writer.write_str(attachment.mimeType)
+                writer.write_bytes(attachment.data)
+            return SimpleMessage(mtype="askbinary", payload=writer.close())
+        return SimpleMessage(mtype="ask", payload=writer.close())
+
+    async def upload_request(self, client : BidirectionalClient, mtype : str, prefix : bytes, sections : list[Attachment]):
+        """
+        Streams a request over UploadMessage - prefix, then each section as mime type, length and bytes -
+        and returns the small "uploaded" message that has the server run it as mtype.
+        """
+        def pieces():
+            yield prefix
+            for attachment in sections:
+                writer=ChunkWriter()
+                writer.write_str(attachment.mimeType)
+                writer.write_int(attachment.size)
+                yield writer.close()
+                yield from attachment.chunks(UPLOAD_CHUNK_SIZE)
+        writer=ChunkWriter()
+        writer.write_str(client.guid)
+        writer.write_str(mtype)
+        response = await client.upload("__request__", writer.close(), pieces())
+        if response.mtype != "ok":
+            raise Exception(f"Request upload failed: {ChunkReader(response.payload).read_str()}")
+        writer=ChunkWriter()
+        writer.write_str(ChunkReader(response.payload).read_str())
+        return SimpleMessage(mtype="uploaded", payload=writer.close())
+
     def download_blob(self,sas_url):
-        response = requests.get(sas_url)
-        response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-        return response.content.decode('utf-8')
+        return bytes(self.connection.blobs.fetch(sas_url)).decode('utf-8')
     
     def dict_to_dataclass(self,cls, data):
         if not isinstance(data, dict):
@@ -226,52 +741,268 @@ class LlmClient:
                     fields[field_name] = data[field_name]
         return cls(**fields)
 
-    async def SendSurely(self, message : SimpleMessage, expect_llmoutput: bool):
+    async def cache_get(self, hex_hash: str):
+        if self.memory_cache is not None:
+            output = self.memory_cache.get(hex_hash)
+            if output is not None:
+                return output
+        # disk access and JSON parsing run in the cache thread pool, not on the event loop
+        loop = asyncio.get_running_loop()
+        data_dict = await loop.run_in_executor(cache_executor(), self.cache.get, hex_hash)
+        if data_dict is None:
+            return None
+        output = self.dict_to_dataclass(LlmSimpleOutput, data_dict)
+        if self.memory_cache is not None:
+            self.memory_cache.put(hex_hash, output)
+        return output
+
+    async def cache_put(self, hex_hash: str, output: LlmSimpleOutput):
+        if self.memory_cache is not None:
+            self.memory_cache.put(hex_hash, output)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(cache_executor(), self.cache.put, hex_hash, asdict(output))
+
+    async def cache_get_legacy(self, requestJSON: str):
+        if not self.legacy_keys:
+            return None
+        legacy_hash = hashlib.sha256(requestJSON.encode('utf-8')).hexdigest()
+        return await self.cache_get(legacy_hash)
+
+    async def to_simple_output(self, data_dict):
+        llmOut = self.dict_to_dataclass(LlmOutput, data_dict)
+        simpleOut=LlmSimpleOutput(llmOut.answer,llmOut.error)
+        if llmOut.answerReference!=None:
+            #retrieve answer from blob storage (in the download pool, off the event loop)
+            data_dict = await self.connection.blobs.download_json(llmOut.answerReference)
+            simpleOut.answer = self.dict_to_dataclass(CachedEntry, data_dict)
+        return simpleOut
+
+    async def SendSurely(self, message, expect_llmoutput: bool, decode = None):
+        # decode, if given, turns the reply's ChunkReader into the return value
+        # message is a SimpleMessage or an async callable that prepares it for a session (e.g. by uploading it first)
+        # retries follow self.retry_policy - by default forever
+        started = time.monotonic()
+        attempt = 0
         while True:
+            client = self.client
             try:
-                response = await asyncio.wait_for(self.client.send_receive(message), timeout=300)
+                request = message if isinstance(message, SimpleMessage) else await message(client)
+                response = await asyncio.wait_for(client.send_receive(request), timeout=self.retry_policy.request_timeout)
                 reader=ChunkReader(response.payload)
+                if decode is not None:
+                    return decode(reader)
                 if expect_llmoutput:
-                    data_dict = json.loads(reader.read_str())
-                    llmOut = self.dict_to_dataclass(LlmOutput, data_dict)
-                    simpleOut=LlmSimpleOutput(llmOut.answer,llmOut.error)
-                    if llmOut.answerReference!=None:
-                        #retrieve answer from blob storage
-                        data_dict = json.loads(self.download_blob(llmOut.answerReference))
-                        simpleOut.answer = self.dict_to_dataclass(CachedEntry, data_dict)
-                    return simpleOut
+                    return await self.to_simple_output(json.loads(reader.read_str()))
                 else:
                     return None
             except Exception as e:
-                print(f"Error while trying to send task to server - retrying...")
-                # make a new connection
-                # The connect() method now handles closing the old broken client
-                await self.connect()
-                await asyncio.sleep(5)
+                attempt += 1
+                self.retry_policy.check(attempt, started, e)
+                print(f"Error while trying to send task to server - retrying: {e!r}")
+                await self.recover(client, attempt, e)
 
     async def Ask(self, chat : Chat, tags : list[str], cache_only : bool = False, retries: int = -1):
+        hex_hash = chat.cache_key()
+        # the cache lookup is part of the flight: a caller arriving before the answer is stored joins it instead
+        return await self.coalesce((hex_hash, cache_only), lambda: self._ask(chat, hex_hash, tags, cache_only, retries))
+
+    async def _ask(self, chat : Chat, hex_hash : str, tags : list[str], cache_only : bool, retries: int):
         #check local cache
-        chatJSON=json.dumps(chat.to_dict(), indent=4)
-        hex_hash = hashlib.sha256(chatJSON.encode('utf-8')).hexdigest()
-        cachePath=Path(f"{os.environ['LLM_CACHE']}/{hex_hash}")
-        if cachePath.exists():
-            with open(cachePath, 'r', encoding='utf-8') as f:
-                data_dict = json.load(f)
-                return self.dict_to_dataclass(LlmSimpleOutput, data_dict)
-        writer=ChunkWriter()
-        writer.write_str(chatJSON)
-        writer.write_str(json.dumps(tags))
-        if cache_only:
-            writer.write_int(1)
-        else:
-            writer.write_int(0)
-        writer.write_int(retries)
-        output=await self.SendSurely(SimpleMessage(mtype="ask", payload=writer.close()),True)
+        cached = await self.cache_get(hex_hash)
+        if cached is not None:
+            return cached
+        chatJSON=None
+        # the legacy key hashes the inline JSON - not worth reading and encoding file-backed attachments for
+        if self.legacy_keys and not any(a.path for a in attachments(chat.query)):
+            chatJSON=json.dumps(chat.query, indent=4, default=json_default)
+            cached = await self.cache_get_legacy(chatJSON)
+            if cached is not None:
+                return cached
+        message = await self.encode_ask(chat, tags, cache_only, retries, chatJSON)
+        async with self.schedule(chat.query["model"], estimate_tokens(chat.query["messages"])) as usage:
+            output=await self.SendSurely(message,True)
+            usage.append(output)
         if output.error is None:
-            with open(cachePath, 'w', encoding='utf-8') as f:
-                json.dump(asdict(output), f, indent=4)
+            await self.cache_put(hex_hash, output)
         return output
 
+    async def AskStream(self, chat : Chat, tags : list[str], retries: int = -1):
+        """
+        Asks a chat and yields the answer while it is generated: text deltas (str) as they arrive, then the final
+        LlmSimpleOutput with RunMetaData. A stream that breaks before the first delta is retried like Ask; one that
+        breaks after deltas were yielded raises AnswerStreamBroken with the text so far - asking again would generate
+        (and bill) a new answer that need not match it, so the caller decides whether to call Ask.
+        Cached answers and servers without the "askstream" capability yield the whole answer as one delta.
+        """
+        if "askstream" not in self.client.capabilities:
+            output = await self.Ask(chat, tags, retries=retries)
+            if output.answer is not None and output.answer.ChatAnswer:
+                yield output.answer.ChatAnswer
+            yield output
+            return
+        hex_hash = chat.cache_key()
+        if self.single_flight is not None and (hex_hash, False) in self.single_flight:
+            # the same chat is already being asked - wait for that answer instead of generating it twice
+            output = await self.Ask(chat, tags, retries=retries)
+            if output.answer is not None and output.answer.ChatAnswer:
+                yield output.answer.ChatAnswer
+            yield output
+            return
+        cached = await self.cache_get(hex_hash)
+        chatJSON=None
+        if cached is None and self.legacy_keys and not any(a.path for a in attachments(chat.query)):
+            chatJSON=json.dumps(chat.query, indent=4, default=json_default)
+            cached = await self.cache_get_legacy(chatJSON)
+        if cached is not None:
+            if cached.answer is not None and cached.answer.ChatAnswer:
+                yield cached.answer.ChatAnswer
+            yield cached
+            return
+        message = await self.encode_ask(chat, tags, False, retries, chatJSON)
+        async with self.schedule(chat.query["model"], estimate_tokens(chat.query["messages"])) as usage:
+            streamed = []
+            started = time.monotonic()
+            attempt = 0
+            while True:
+                client = self.client
+                try:
+                    output = None
+                    request = message if isinstance(message, SimpleMessage) else await message(client)
+                    call = client.stub.DownloadMessage(await self.stream_request(client, request))
+                    try:
+                        while True:
+                            # same idle limit as SendSurely, but per message - long generations keep the stream open
+                            msg = await asyncio.wait_for(call.read(), timeout=self.retry_policy.request_timeout)
+                            if msg is grpc.aio.EOF:
+                                break
+                            if msg.encoding:
+                                msg = await client.decode_message(msg)
+                            if msg.mtype == "delta":
+                                delta = msg.payload.decode("utf-8")
+                                streamed.append(delta)
+                                yield delta
+                            else:
+                                output = await self.to_simple_output(json.loads(ChunkReader(msg.payload).read_str()))
+                    finally:
+                        call.cancel()
+                    if output is None:
+                        raise ConnectionError("answer stream ended without a final answer")
+                    break
+                except Exception as e:
+                    if streamed:
+                        raise AnswerStreamBroken(f"Answer stream broke after {len(streamed)} deltas: {e}", "".join(streamed)) from e
+                    attempt += 1
+                    self.retry_policy.check(attempt, started, e)
+                    print(f"Error while trying to send task to server - retrying: {e!r}")
+                    await self.recover(client, attempt, e)
+            usage.append(output)
+        if output.error is None:
+            await self.cache_put(hex_hash, output)
+        yield output
+
+    async def stream_request(self, client : BidirectionalClient, message : SimpleMessage):
+        # DownloadMessage is not tied to the session stream: name the session and the wrapped message type first
+        writer=ChunkWriter()
+        writer.write_str(client.guid)
+        writer.write_str(message.mtype)
+        return await client.encode_message(SimpleMessage(mtype="askstream", payload=writer.close() + message.payload))
+
+    async def AskMany(self, chats : list[Chat], tags : list[str], concurrency : int = 32, cache_only : bool = False, retries: int = -1):
+        """
+        Asks many chats and yields (index, LlmSimpleOutput) pairs as soon as each one completes.
+        Local cache hits are yielded first; misses are sent with at most `concurrency` requests in flight.
+        """
+        results = asyncio.Queue()
+        misses = asyncio.Queue()
+
+        async def probe():
+            # cache lookups run in the cache thread pool, a block at a time
+            for start in range(0, len(chats), 256):
+                indices = range(start, min(start + 256, len(chats)))
+                outputs = await asyncio.gather(*[self.cache_get(chats[i].cache_key()) for i in indices])
+                for i, output in zip(indices, outputs):
+                    if output is not None:
+                        results.put_nowait((i, output))
+                    else:
+                        misses.put_nowait(i)
+            for _ in range(concurrency):
+                misses.put_nowait(None)
+
+        async def worker():
+            while True:
+                i = await misses.get()
+                if i is None:
+                    break
+                results.put_nowait((i, await self.Ask(chats[i], tags, cache_only, retries)))
+
+        tasks = [asyncio.create_task(probe())] + [asyncio.create_task(worker()) for _ in range(concurrency)]
+        for task in tasks:
+            # surface failures of the helpers through the results queue
+            task.add_done_callback(lambda t: results.put_nowait(t) if not t.cancelled() and t.exception() is not None else None)
+        try:
+            for _ in range(len(chats)):
+                item = await results.get()
+                if isinstance(item, asyncio.Task):
+                    raise item.exception()
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def ProbeCache(self, chats : list[Chat], tags : list[str], include_answers : bool = False, batch_size : int = 1000):
+        """
+        Finds out which chats are already answered without asking them. The local cache is checked first;
+        the rest is sent to the server in bundles of batch_size chats, one round trip per bundle.
+        Returns a CacheProbe with a hit flag per chat and, if include_answers is set, the cached answers.
+        Servers without the "probecache" capability are probed with cache-only asks, at most 32 at a time.
+        """
+        hits = [False] * len(chats)
+        answers = [None] * len(chats)
+        remaining = []
+        for start in range(0, len(chats), batch_size):
+            indices = range(start, min(start + batch_size, len(chats)))
+            outputs = await asyncio.gather(*[self.cache_get(chats[i].cache_key()) for i in indices])
+            for i, output in zip(indices, outputs):
+                if output is not None:
+                    hits[i] = True
+                    answers[i] = output
+                else:
+                    remaining.append(i)
+
+        if "probecache" not in self.client.capabilities:
+            semaphore = asyncio.Semaphore(32)
+
+            async def probe(i):
+                async with semaphore:
+                    output = await self.Ask(chats[i], tags, cache_only=True)
+                if output.error is None:
+                    hits[i] = True
+                    answers[i] = output
+
+            await asyncio.gather(*[probe(i) for i in remaining])
+            return CacheProbe(hits, answers if include_answers else None)
+
+        def decode(reader):
+            return json.loads(reader.read_str())
+
+        for start in range(0, len(remaining), batch_size):
+            indices = remaining[start:start + batch_size]
+            writer=ChunkWriter()
+            writer.write_str(json.dumps([chats[i] for i in indices], default=lambda obj: obj.to_dict(), indent=4))
+            writer.write_str(json.dumps(tags))
+            writer.write_int(1 if include_answers else 0)
+            reply = await self.SendSurely(SimpleMessage(mtype="probemany", payload=writer.close()),False,decode)
+            for i, hit, answer in zip(indices, reply["hits"], reply.get("answers") or [None] * len(indices)):
+                hits[i] = bool(hit)
+                if hit and answer is not None:
+                    answers[i] = await self.to_simple_output(answer)
+                    if answers[i].error is None:
+                        await self.cache_put(chats[i].cache_key(), answers[i])
+        if not include_answers:
+            answers = None
+        return CacheProbe(hits, answers)
+
     async def AskBackground(self, chats : list[Chat], tags : list[str], retries: int = -1):
         writer=ChunkWriter()
         writer.write_str(json.dumps(chats, default=lambda obj: obj.to_dict(), indent=4))
@@ -279,27 +1010,141 @@ class LlmClient:
         writer.write_int(retries)
         await self.SendSurely(SimpleMessage(mtype="askmany", payload=writer.close()),False) 
 
-    async def Embed(self, input : Embedding, tags : list[str], cache_only : bool = False, retries: int = -1):
+    @staticmethod
+    def embedding_output(output : LlmSimpleOutput, as_numpy : bool, dtype : str = "float32"):
+        # cached vectors may be read-only arrays or lists - hand out the requested type without touching the cached object
+        if output.answer is None or output.answer.Embedding is None:
+            return output
+        vector = output.answer.Embedding
+        if as_numpy:
+            if np is None:
+                raise ImportError("numpy is required for as_numpy=True - pip install numpy")
+            if isinstance(vector, np.ndarray) and vector.dtype == np.dtype(dtype):
+                return output
+            vector = np.asarray(vector, dtype=dtype)
+        else:
+            if isinstance(vector, list):
+                return output
+            vector = vector.tolist()
+        return LlmSimpleOutput(replace(output.answer, Embedding=vector), output.error)
+
+    async def Embed(self, input : Embedding, tags : list[str], cache_only : bool = False, retries: int = -1, as_numpy : bool = False, dtype : str = "float32"):
+        """
+        Embeds a text. With as_numpy the vector is returned as a numpy array of dtype (float32 or float16),
+        zero-copy from the cache where possible; otherwise as a list of floats.
+        """
+        hex_hash = input.cache_key()
+        output = await self.coalesce((hex_hash, cache_only), lambda: self._embed(input, hex_hash, tags, cache_only, retries))
+        return self.embedding_output(output, as_numpy, dtype)
+
+    async def _embed(self, input : Embedding, hex_hash : str, tags : list[str], cache_only : bool, retries: int):
+        cached = await self.cache_get(hex_hash)
+        if cached is not None:
+            return cached
         inputJSON=json.dumps(input.to_dict(), indent=4)
-        hex_hash = hashlib.sha256(inputJSON.encode('utf-8')).hexdigest()
-        cachePath=Path(f"{os.environ['LLM_CACHE']}/{hex_hash}")
-        if cachePath.exists():
-            with open(cachePath, 'r', encoding='utf-8') as f:
-                data_dict = json.load(f)
-                return self.dict_to_dataclass(LlmSimpleOutput, data_dict)
+        cached = await self.cache_get_legacy(inputJSON)
+        if cached is not None:
+            return cached
         writer=ChunkWriter()
-        writer.write_str(json.dumps(input.to_dict(), indent=4))
+        writer.write_str(inputJSON)
         writer.write_str(json.dumps(tags))
         if cache_only:
             writer.write_int(1)
         else:
             writer.write_int(0)
         writer.write_int(retries)
-        output=await self.SendSurely(SimpleMessage(mtype="embed", payload=writer.close()),True)
-        with open(cachePath, 'w', encoding='utf-8') as f:
-            json.dump(asdict(output), f, indent=4)
+        async with self.schedule(input.to_dict()["model"], estimate_tokens(input.to_dict()["text"])) as usage:
+            output=await self.SendSurely(SimpleMessage(mtype="embed", payload=writer.close()),True)
+            usage.append(output)
+        await self.cache_put(hex_hash, output)
         return output
 
+    async def EmbedBatch(self, texts : list[str], model : str = "text-embedding-3-large_1", tags : list[str] = None, cache_only : bool = False, retries: int = -1,
+                         max_batch_items : int = 256, max_batch_bytes : int = 1024 * 1024, concurrency : int = 4):
+        """
+        Embeds many texts. Duplicates are embedded once, cache hits are served locally and the misses are packed
+        into embedbatch frames of at most max_batch_items texts / max_batch_bytes bytes, concurrency frames in flight.
+        Returns an EmbedBatchOutput whose vectors are in input order: one stacked float32 array (rows of failed
+        texts are NaN) if numpy is installed, otherwise a list with None for failed texts.
+        """
+        tags = tags if tags is not None else []
+        unique = list(dict.fromkeys(texts))
+        inputs = [Embedding(text, model) for text in unique]
+        outputs = [None] * len(unique)
+
+        misses = []
+        for start in range(0, len(inputs), 1024):
+            indices = range(start, min(start + 1024, len(inputs)))
+            cached = await asyncio.gather(*[self.cache_get(inputs[i].cache_key()) for i in indices])
+            for i, output in zip(indices, cached):
+                if output is None and self.legacy_keys:
+                    output = await self.cache_get_legacy(json.dumps(inputs[i].to_dict(), indent=4))
+                if output is not None:
+                    outputs[i] = output
+                else:
+                    misses.append(i)
+
+        batches = []
+        batch = []
+        size = 0
+        for i in misses:
+            length = len(unique[i].encode("utf-8"))
+            if batch and (len(batch) >= max_batch_items or size + length > max_batch_bytes):
+                batches.append(batch)
+                batch = []
+                size = 0
+            batch.append(i)
+            size += length
+        if batch:
+            batches.append(batch)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(batch):
+            async with semaphore:
+                if "embedbatch" not in self.client.capabilities:
+                    # older servers: one embed request per text, multiplexed over the session
+                    results = await asyncio.gather(*[self.Embed(inputs[i], tags, cache_only, retries) for i in batch])
+                    for i, output in zip(batch, results):
+                        outputs[i] = output
+                    return
+                writer=ChunkWriter()
+                writer.write_str(json.dumps([inputs[i].to_dict() for i in batch]))
+                writer.write_str(json.dumps(tags))
+                writer.write_int(1 if cache_only else 0)
+                writer.write_int(retries)
+                async with self.schedule(model, sum(estimate_tokens(unique[i]) for i in batch), len(batch)) as usage:
+                    reply = await self.SendSurely(SimpleMessage(mtype="embedbatch", payload=writer.close()),False,lambda reader: json.loads(reader.read_str()))
+                    if not isinstance(reply, list) or len(reply) != len(batch):
+                        # rows cannot be matched to texts - fail the whole batch rather than misattribute vectors
+                        error = f"embedbatch reply has {len(reply) if isinstance(reply, list) else 'no'} items for {len(batch)} texts"
+                        reply = [{"answer": None, "answerReference": None, "error": error, "isCached": False}] * len(batch)
+                    for i, data_dict in zip(batch, reply):
+                        outputs[i] = await self.to_simple_output(data_dict)
+                    usage.extend(outputs[i] for i in batch)
+                for i in batch:
+                    if outputs[i].error is None:
+                        await self.cache_put(inputs[i].cache_key(), outputs[i])
+
+        await asyncio.gather(*[send(batch) for batch in batches])
+
+        errors = []
+        vectors = []
+        by_text = dict(zip(unique, outputs))
+        for text in texts:
+            output = by_text[text]
+            failed = output is None or output.error is not None or output.answer is None or output.answer.Embedding is None
+            errors.append((output.error if output is not None and output.error is not None else "no embedding returned") if failed else None)
+            vectors.append(None if failed else output.answer.Embedding)
+        if np is None:
+            return EmbedBatchOutput([list(v) if v is not None else None for v in vectors], errors)
+        dim = next((len(v) for v in vectors if v is not None), 0)
+        matrix = np.full((len(texts), dim), np.nan, dtype=np.float32)
+        for row, vector in enumerate(vectors):
+            if vector is not None:
+                matrix[row] = vector
+        return EmbedBatchOutput(matrix, errors)
+
     async def EmbedBackground(self, inputs : list[Embedding], tags : list[str], retries: int = -1):
         writer=ChunkWriter()
         writer.write_str(json.dumps(inputs, default=lambda obj: obj.to_dict(), indent=4))
@@ -311,10 +1156,23 @@ class LlmClient:
         await self.client.close()
 
 class LlmFactory:
-    def __init__(self):        
-        self.connection = GrpcConnection()
+    def __init__(self, cache : CacheStore = None, memory_cache : LruCache = None, retry_policy : RetryPolicy = None, channels : int = None, channel_options : dict = None,
+                 rate_limiter : RateLimiter = None, single_flight : SingleFlight = None):        
+        # sessions share one channel unless channels (or LLM_GRPC_CHANNELS) asks for a pool of them
+        channels = channels if channels is not None else int(os.environ.get("LLM_GRPC_CHANNELS", 1))
+        if channels > 1:
+            self.connection = ConnectionPool(channels, channel_options)
+        else:
+            self.connection = GrpcConnection(channel_options)
+        self.cache = cache
+        self.memory_cache = memory_cache
+        self.retry_policy = retry_policy
+        # one limiter for all clients of the factory, so budgets hold across sessions
+        self.rate_limiter = rate_limiter if rate_limiter is not None else default_rate_limiter()
+        # and one set of in-flight requests, so identical requests of different clients are sent once
+        self.single_flight = single_flight if single_flight is not None else default_single_flight()
 
     async def create_client(self):
-        client = LlmClient(self.connection)
+        client = LlmClient(self.connection, self.cache, self.memory_cache, self.retry_policy, self.rate_limiter, self.single_flight)
         await client.connect()
         return client
\ No newline at end of file
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Any
 
 @dataclass
 class RunMetaData:
@@ -48,3 +49,18 @@ class LlmSimpleOutput:
         self.answer = answer
         self.error = error
 
+@dataclass
+class CacheProbe:
+    hits : list[bool]
+    answers : list[LlmSimpleOutput]
+    def __init__(self, hits : list[bool], answers : list[LlmSimpleOutput]):
+        self.hits = hits
+        self.answers = answers
+
+@dataclass
+class EmbedBatchOutput:
+    vectors : Any
+    errors : list[str]
+    def __init__(self, vectors : Any, errors : list[str]):
+        self.vectors = vectors
+        self.errors = errors
@@ -0,0 +1,123 @@
+import asyncio
+from contextlib import asynccontextmanager
+from .LlmLib import LlmFactory, LlmClient
+from .Models import Chat, Embedding
+from .RetryPolicy import RetryPolicy
+
+
+class LlmPool:
+    """
+    A fixed set of warm LlmClient sessions:
+        - sessions are created up front by one LlmFactory
+        - callers lease a session and queue while all sessions are busy
+        - sessions whose stream died are replaced in the background, retrying until the server answers again
+    """
+
+    def __init__(self, factory: LlmFactory, size: int):
+        self.factory = factory
+        self.size = size
+        self._idle = asyncio.Queue()
+        self._clients = set()
+        self._replacements = set()
+        self._closed = False
+        # a factory made by create() is closed with the pool
+        self._owns_factory = False
+
+    # ----------------------------------------
+    # FACTORY METHOD (async init)
+    # ----------------------------------------
+    @classmethod
+    async def create(cls, size: int = 8, factory: LlmFactory = None):
+        self = cls(factory if factory is not None else LlmFactory(), size)
+        self._owns_factory = factory is None
+        try:
+            clients = await asyncio.gather(*[self.factory.create_client() for _ in range(size)], return_exceptions=True)
+        except BaseException:
+            if self._owns_factory:
+                await self.factory.connection.close()
+            raise
+        errors = [client for client in clients if isinstance(client, BaseException)]
+        if errors:
+            # close the sessions that did open before giving up
+            await asyncio.gather(*[client.Close() for client in clients if not isinstance(client, BaseException)], return_exceptions=True)
+            if self._owns_factory:
+                await self.factory.connection.close()
+            raise errors[0]
+        for client in clients:
+            self._clients.add(client)
+            self._idle.put_nowait(client)
+        return self
+
+    # ----------------------------------------
+    # LEASING
+    # ----------------------------------------
+    @asynccontextmanager
+    async def lease(self):
+        if self._closed:
+            raise RuntimeError("pool is closed")
+        client = await self._idle.get()
+        try:
+            yield client
+        finally:
+            # a caller's error says nothing about the session - only a dead stream does
+            if client.client is None or not client.client.is_connected:
+                self._replace(client)
+            else:
+                self._idle.put_nowait(client)
+
+    def _replace(self, client: LlmClient):
+        self._clients.discard(client)
+        task = asyncio.create_task(self._replace_session(client))
+        self._replacements.add(task)
+        task.add_done_callback(self._replacements.discard)
+
+    async def _replace_session(self, client: LlmClient):
+        try:
+            await client.Close()
+        except Exception:
+            pass
+        # the pool must not shrink: a bounded retry policy gives up on create_client(), so try again
+        policy = self.factory.retry_policy if self.factory.retry_policy is not None else RetryPolicy()
+        attempt = 0
+        while True:
+            if self._closed:
+                return
+            try:
+                fresh = await self.factory.create_client()
+                break
+            except Exception as e:
+                attempt += 1
+                print(f"Could not replace pool session - retrying: {e}")
+                await asyncio.sleep(policy.delay(attempt))
+        if self._closed:
+            await fresh.Close()
+            return
+        self._clients.add(fresh)
+        self._idle.put_nowait(fresh)
+
+    # ----------------------------------------
+    # CONVENIENCE WRAPPERS
+    # ----------------------------------------
+    async def Ask(self, chat : Chat, tags : list[str], cache_only : bool = False, retries: int = -1):
+        async with self.lease() as client:
+            return await client.Ask(chat, tags, cache_only=cache_only, retries=retries)
+
+    async def AskStream(self, chat : Chat, tags : list[str], retries: int = -1):
+        # the session stays leased until the stream is finished or abandoned
+        async with self.lease() as client:
+            async for item in client.AskStream(chat, tags, retries=retries):
+                yield item
+
+    async def Embed(self, input : Embedding, tags : list[str], cache_only : bool = False, retries: int = -1):
+        async with self.lease() as client:
+            return await client.Embed(input, tags, cache_only=cache_only, retries=retries)
+
+    async def Close(self):
+        self._closed = True
+        for task in list(self._replacements):
+            task.cancel()
+        await asyncio.gather(*self._replacements, return_exceptions=True)
+        await asyncio.gather(*[client.Close() for client in self._clients], return_exceptions=True)
+        self._clients.clear()
+        if self._owns_factory:
+            await self.factory.connection.close()
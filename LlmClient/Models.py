@@ -2,9 +2,145 @@ import json
 from jsonschema import Draft202012Validator, SchemaError
 from typing import Any
 import base64
+import os
+import binascii
+import hashlib
 import puremagic
 import mimetypes
 
+
+class Attachment:
+    """
+    Raw bytes of an image or file in a chat, either in memory or read from a file on demand. Remembers the
+    sha256 digest of the bytes so cache keys never hash the content again; the base64 data URL is only built
+    when the chat is serialized inline.
+    """
+    def __init__(self, mimeType: str, data: bytes = None, path: str = None):
+        self.mimeType = mimeType
+        self.path = path
+        self._data = data
+        if data is not None:
+            self.size = len(data)
+            self.digest = hashlib.sha256(data).digest()
+        else:
+            self.size = os.path.getsize(path)
+            hasher = hashlib.sha256()
+            for block in self.chunks(1024 * 1024):
+                hasher.update(block)
+            self.digest = hasher.digest()
+
+    @classmethod
+    def from_file(cls, path: str, mimeType: str = None):
+        if mimeType is None:
+            mimeType = puremagic.from_file(path, mime=True)
+        return cls(mimeType, path=path)
+
+    @property
+    def data(self) -> bytes:
+        # file-backed attachments are read in full only where all bytes are needed at once
+        if self._data is not None:
+            return self._data
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def chunks(self, size: int):
+        """Yields the bytes in pieces of at most size bytes - file-backed attachments are read lazily."""
+        if self._data is not None:
+            view = memoryview(self._data)
+            for start in range(0, len(view), size):
+                yield view[start:start + size]
+        else:
+            with open(self.path, 'rb') as f:
+                while block := f.read(size):
+                    yield block
+
+    def data_url(self) -> str:
+        # built on every call, not kept: it is 1.33x the bytes and only needed while a chat is serialized inline
+        return "data:"+self.mimeType+";base64," + base64.b64encode(self.data).decode("utf-8")
+
+    def to_dict(self):
+        # lets json.dumps(..., default=lambda obj: obj.to_dict()) write attachments inline
+        return self.data_url()
+
+
+def json_default(obj):
+    """json.dumps default that writes attachments as inline data URLs."""
+    if isinstance(obj, Attachment):
+        return obj.data_url()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _feed(hasher, obj):
+    if isinstance(obj, dict):
+        hasher.update(b"{")
+        for key in sorted(obj):
+            _feed(hasher, key)
+            hasher.update(b":")
+            _feed(hasher, obj[key])
+            hasher.update(b",")
+        hasher.update(b"}")
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(b"[")
+        for item in obj:
+            _feed(hasher, item)
+            hasher.update(b",")
+        hasher.update(b"]")
+    elif isinstance(obj, Attachment):
+        hasher.update(b"#" + obj.mimeType.encode("utf-8") + b";")
+        hasher.update(obj.digest)
+    elif isinstance(obj, str):
+        if obj.startswith("data:") and ";base64," in obj[:200]:
+            # plain data URL (e.g. a chat rebuilt from JSON) - hash the raw bytes like Attachment does
+            header, _, encoded = obj.partition(";base64,")
+            try:
+                data = base64.b64decode(encoded, validate=True)
+            except (binascii.Error, ValueError):
+                data = None
+            if data is not None:
+                hasher.update(b"#" + header[5:].encode("utf-8") + b";")
+                hasher.update(hashlib.sha256(data).digest())
+                return
+        hasher.update(json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+    else:
+        hasher.update(json.dumps(obj).encode("utf-8"))
+
+
+def attachments(obj):
+    """Yields every Attachment in a JSON-like structure."""
+    if isinstance(obj, dict):
+        for value in obj.values():
+            yield from attachments(value)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            yield from attachments(item)
+    elif isinstance(obj, Attachment):
+        yield obj
+
+
+def replace_attachments(obj, replacement):
+    """Returns a copy of a JSON-like structure with every Attachment replaced by replacement(attachment)."""
+    if isinstance(obj, dict):
+        return {key: replace_attachments(value, replacement) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [replace_attachments(item, replacement) for item in obj]
+    if isinstance(obj, Attachment):
+        return replacement(obj)
+    return obj
+
+
+def attachment_reference(attachment: Attachment) -> str:
+    return "attachment:sha256:" + attachment.digest.hex()
+
+
+def canonical_hash(obj) -> str:
+    """
+    sha256 hex digest of a JSON-like structure: keys sorted, no whitespace, attachments by raw-byte digest.
+    The structure is walked incrementally so no serialized copy is built.
+    """
+    hasher = hashlib.sha256()
+    _feed(hasher, obj)
+    return hasher.hexdigest()
+
 class MessageFragments:
     def __init__(self):
         self.content=[]
@@ -14,11 +150,19 @@ class MessageFragments:
     
     def AddImage(self, image :bytes):
         mimeType = puremagic.from_string(image, mime=True)
-        self.content.append({"type": "input_image", "image_url": "data:"+mimeType+";base64," + base64.b64encode(image).decode("utf-8")})
+        self.content.append({"type": "input_image", "image_url": Attachment(mimeType, image)})
 
     def AddFile(self, doc :bytes):
         mimeType = puremagic.from_string(doc, mime=True)
-        self.content.append({"type": "input_file", "filename":f"file.{mimetypes.guess_extension(mimeType)}", "file_data": "data:"+mimeType+";base64," + base64.b64encode(doc).decode("utf-8")})
+        self.content.append({"type": "input_file", "filename":f"file.{mimetypes.guess_extension(mimeType)}", "file_data": Attachment(mimeType, doc)})
+
+    def AddImagePath(self, path :str):
+        # the image is read from disk when the chat is sent, in chunks where the server allows it
+        self.content.append({"type": "input_image", "image_url": Attachment.from_file(path)})
+
+    def AddFilePath(self, path :str):
+        attachment = Attachment.from_file(path)
+        self.content.append({"type": "input_file", "filename":f"file.{mimetypes.guess_extension(attachment.mimeType)}", "file_data": attachment})
 
 
 class Chat:
@@ -36,33 +180,66 @@ class Chat:
             }
         if tools:
             self.query["tools"] = tools
+        self._key = None
+
+    @classmethod
+    def from_dict(cls, query: dict):
+        """Rebuilds a chat from its to_dict() / getJSON() form (the response schema is not validated again)."""
+        chat = cls.__new__(cls)
+        chat.query = query
+        chat._key = None
+        return chat
 
 
     def AddSystemMessage(self, message :str):
         self.query["messages"].append({"role": "system", "content": message})
+        self._key = None
 
     def AddSystemMessageList(self,fragments: MessageFragments):
-        self.query["messages"].append({"role": "system", "content": fragments.content})    
+        self.query["messages"].append({"role": "system", "content": fragments.content})
+        self._key = None
 
     def AddAssistantMessage(self, message :str):
         self.query["messages"].append({"role": "assistant", "content": message})
+        self._key = None
 
     def AddAssistantMessageList(self,fragments: MessageFragments):
-        self.query["messages"].append({"role": "assistant", "content": fragments.content})    
+        self.query["messages"].append({"role": "assistant", "content": fragments.content})
+        self._key = None
 
     def AddUserMessage(self, message :str):
         self.query["messages"].append({"role": "user", "content": message})
+        self._key = None
 
     def AddUserMessageList(self,fragments: MessageFragments):
-        self.query["messages"].append({"role": "user", "content": fragments.content})    
+        self.query["messages"].append({"role": "user", "content": fragments.content})
+        self._key = None
 
 
     def to_dict(self):
-        return self.query
+        """
+        Returns the query as plain JSON: attachments become inline data URLs in a copy, so json.dumps works on it.
+        Without attachments this is the query itself. The client sends query, where attachments stay raw bytes.
+        """
+        if not any(True for _ in attachments(self.query)):
+            return self.query
+        return replace_attachments(self.query, Attachment.data_url)
+
+    def cache_key(self):
+        """
+        Canonical cache key of the query. It is memoized until the chat is changed through
+        its Add* methods - call invalidate() after editing query or added fragments directly.
+        """
+        if self._key is None:
+            self._key = canonical_hash(self.query)
+        return self._key
+
+    def invalidate(self):
+        self._key = None
     
     def getJSON(self):
         """Returns the JSON string representation of the query."""
-        return json.dumps(self.query, indent=4)
+        return json.dumps(self.query, indent=4, default=json_default)
 
 
 class Embedding:
@@ -71,12 +248,19 @@ class Embedding:
                 "model": model,
                 "text" : text
             }
+        self._key = None
 
 
     def to_dict(self):
         """Returns the JSON representation of the embedding."""
         return self.embedding
 
+    def cache_key(self):
+        """Canonical cache key of the embedding request (memoized)."""
+        if self._key is None:
+            self._key = canonical_hash(self.embedding)
+        return self._key
+
     def getJSON(self):
         """Returns the JSON string representation of the embedding."""
         return json.dumps(self.embedding, indent=4)
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+
+# error texts that mean the server (or the model provider behind it) is throttling us
+THROTTLE_MARKERS = ("429", "rate limit", "ratelimit", "too many requests", "throttl", "quota")
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+        # FIFO: waiters take their share in arrival order
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def take(self, amount: float):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.level < amount:
+                await asyncio.sleep((amount - self.level) / self.rate)
+                self._refill()
+            self.level -= amount
+
+    def adjust(self, amount: float):
+        # settle an estimate once the real usage is known - the level may go negative (debt)
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class ModelLimiter:
+    """
+    Budget and adaptive concurrency of one model:
+        - rpm / tpm: requests and tokens per minute (None: unlimited); tokens are reserved from an estimate
+          before sending and settled with the RunMetaData of the reply
+        - in-flight requests are capped by an AIMD limit: +1 per limit successes, halved on throttling
+          errors, cut by 10% on failures or when latency per token climbs above latency_tolerance times its baseline
+    """
+
+    def __init__(self, rpm: float = None, tpm: float = None, initial_concurrency: int = 8, min_concurrency: int = 1,
+                 max_concurrency: int = 256, latency_tolerance: float = 2.0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        # seconds per token: the best recently seen, and the running average
+        self.baseline = None
+        self.latency = None
+        # completion tokens are unknown before the reply - estimate them from earlier replies
+        self.completion_tokens = 0.0
+        self.completed = 0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._slots = asyncio.Condition()
+
+    async def acquire(self, tokens: float, requests: int = 1):
+        if self.requests is not None:
+            await self.requests.take(requests)
+        if self.tokens is not None:
+            await self.tokens.take(tokens)
+        async with self._slots:
+            await self._slots.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._slots:
+            self.in_flight -= 1
+            free = int(self.limit) - self.in_flight
+            if free > 0:
+                self._slots.notify(free)
+
+    def on_success(self, seconds: float, prompt_tokens: int, completion_tokens: int):
+        self.completed += 1
+        self.completion_tokens += (completion_tokens - self.completion_tokens) * 0.1
+        per_token = seconds / max(1, prompt_tokens + completion_tokens)
+        self.latency = per_token if self.latency is None else self.latency + (per_token - self.latency) * 0.2
+        if self.baseline is None or per_token < self.baseline:
+            self.baseline = per_token
+        else:
+            # let the baseline follow slow drifts (other load, longer prompts)
+            self.baseline += (per_token - self.baseline) * 0.01
+        if self.latency > self.latency_tolerance * self.baseline:
+            self._decrease(0.9, seconds)
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def on_error(self, throttled: bool, seconds: float):
+        if throttled:
+            self.throttled += 1
+            self._decrease(0.5, seconds)
+        else:
+            # failed requests (e.g. a retry policy gave up) - back off gently
+            self._decrease(0.9, seconds)
+
+    def _decrease(self, factor: float, seconds: float):
+        # one cut per round trip - the replies of requests sent before the cut carry no news
+        now = time.monotonic()
+        if now - self._last_decrease < seconds:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit * factor)
+
+    def stats(self):
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "seconds_per_token": self.latency,
+        }
+
+
+class RateLimiter:
+    """
+    Schedules requests per model in front of Ask/Embed (see ModelLimiter). limits maps a model to keyword
+    arguments of ModelLimiter; other models use the defaults. Share one instance between all clients that
+    talk to the same server - LlmFactory does.
+    """
+
+    def __init__(self, limits: dict = None, **defaults):
+        self.limits = limits or {}
+        self.defaults = defaults
+        self.models = {}
+
+    def model(self, name: str) -> ModelLimiter:
+        limiter = self.models.get(name)
+        if limiter is None:
+            limiter = self.models[name] = ModelLimiter(**{**self.defaults, **self.limits.get(name, {})})
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, model: str, prompt_tokens: float, requests: int = 1):
+        """
+        Waits for budget and a concurrency slot, then yields a list the caller appends its
+        LlmSimpleOutput(s) to; usage, latency and errors are recorded when the block ends.
+        """
+        limiter = self.model(model)
+        estimate = prompt_tokens + limiter.completion_tokens * requests
+        await limiter.acquire(estimate, requests)
+        outputs = []
+        started = time.monotonic()
+        try:
+            yield outputs
+        except Exception:
+            limiter.on_error(False, time.monotonic() - started)
+            raise
+        finally:
+            await limiter.release()
+        seconds = time.monotonic() - started
+        used_prompt = used_completion = 0
+        errors = []
+        for output in outputs:
+            if output.error is not None:
+                errors.append(str(output.error).lower())
+            elif output.answer is not None and output.answer.RuntimeData is not None:
+                used_prompt += output.answer.RuntimeData.PromptTokens or 0
+                used_completion += output.answer.RuntimeData.CompletionTokens or 0
+        if limiter.tokens is not None:
+            limiter.tokens.adjust(used_prompt + used_completion - estimate)
+        if any(marker in error for error in errors for marker in THROTTLE_MARKERS):
+            limiter.on_error(True, seconds)
+        elif len(errors) < len(outputs):
+            limiter.on_success(seconds, used_prompt, used_completion)
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in self.models.items()}
+
+
+def estimate_tokens(obj) -> int:
+    """Rough prompt size of a request: ~4 characters per token of its strings (attachments are not counted)."""
+    if isinstance(obj, str):
+        return len(obj) // 4 + 1
+    if isinstance(obj, dict):
+        return sum(estimate_tokens(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_tokens(item) for item in obj)
+    return 0
+
+
+def default_rate_limiter():
+    """
+    Returns a RateLimiter configured from the environment, or None if none of these is set:
+        - LLM_RPM / LLM_TPM: default requests and tokens per minute per model
+        - LLM_MAX_CONCURRENCY: upper bound of the adaptive in-flight limit
+        - LLM_RATE_LIMITS: JSON object of per-model settings, e.g. {"gpt-5-mini_2025-08-07": {"rpm": 500, "tpm": 200000}}
+    """
+    defaults = {}
+    if os.environ.get("LLM_RPM"):
+        defaults["rpm"] = float(os.environ["LLM_RPM"])
+    if os.environ.get("LLM_TPM"):
+        defaults["tpm"] = float(os.environ["LLM_TPM"])
+    if os.environ.get("LLM_MAX_CONCURRENCY"):
+        defaults["max_concurrency"] = int(os.environ["LLM_MAX_CONCURRENCY"])
+    limits = json.loads(os.environ["LLM_RATE_LIMITS"]) if os.environ.get("LLM_RATE_LIMITS") else {}
+    if not defaults and not limits:
+        return None
+    return RateLimiter(limits, **defaults)
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import random
+import time
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of contacting a server that is known to be down."""
+
+
+class RetryPolicy:
+    """
+    How requests and reconnects are retried, from the environment:
+        - LLM_RETRY_INITIAL_DELAY / LLM_RETRY_MAX_DELAY: backoff range in seconds (default 0.1 / 10)
+        - LLM_RETRY_MAX_ATTEMPTS: give up after this many failed attempts (default: never)
+        - LLM_RETRY_DEADLINE: give up after this many seconds (default: never)
+        - LLM_REQUEST_TIMEOUT: seconds to wait for one reply (default 300)
+    Delays grow exponentially with full jitter, so sessions that failed together do not retry together.
+    """
+
+    def __init__(self, initial_delay: float = None, max_delay: float = None, multiplier: float = 2.0,
+                 max_attempts: int = None, deadline: float = None, request_timeout: float = None):
+        def setting(value, name, default, convert=float):
+            if value is not None:
+                return value
+            value = os.environ.get(name)
+            return convert(value) if value else default
+        self.initial_delay = setting(initial_delay, "LLM_RETRY_INITIAL_DELAY", 0.1)
+        self.max_delay = setting(max_delay, "LLM_RETRY_MAX_DELAY", 10.0)
+        self.multiplier = multiplier
+        self.max_attempts = setting(max_attempts, "LLM_RETRY_MAX_ATTEMPTS", None, int)
+        self.deadline = setting(deadline, "LLM_RETRY_DEADLINE", None)
+        self.request_timeout = setting(request_timeout, "LLM_REQUEST_TIMEOUT", 300.0)
+
+    @property
+    def bounded(self) -> bool:
+        # callers that accept failure get it right away while the circuit is open
+        return self.max_attempts is not None or self.deadline is not None
+
+    def delay(self, attempt: int) -> float:
+        """Sleep before retry number attempt (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.initial_delay * self.multiplier ** (attempt - 1)))
+
+    def check(self, attempt: int, started: float, error: Exception):
+        """Raises once attempt failed attempts, or the time since started, exceed the policy."""
+        if self.max_attempts is not None and attempt >= self.max_attempts:
+            raise ConnectionError(f"Giving up after {attempt} attempts: {error}") from error
+        if self.deadline is not None and time.monotonic() - started >= self.deadline:
+            raise TimeoutError(f"Giving up after {self.deadline} s: {error}") from error
+
+
+class CircuitBreaker:
+    """
+    Shared by all sessions of a GrpcConnection, fed by connection attempts:
+        - closed: connects go through; failure_threshold failures in a row open it
+        - open: nobody contacts the server for reset_timeout seconds (doubling up to max_reset_timeout)
+        - half-open: one caller probes the server; success closes the circuit, failure opens it again
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 0.25, max_reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.failures = 0
+        self._timeout = reset_timeout
+        self._opened_at = None
+        self._probing = False
+        self._probe_started = 0.0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self._opened_at >= self._timeout:
+            return "half-open"
+        return "open"
+
+    def record_success(self):
+        self.failures = 0
+        self._timeout = self.reset_timeout
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing:
+            # the probe failed - stay open, for longer
+            self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+            self._opened_at = time.monotonic()
+            self._probing = False
+        elif self._opened_at is None and self.failures >= self.failure_threshold:
+            print(f"Server unreachable after {self.failures} attempts - pausing reconnects")
+            self._opened_at = time.monotonic()
+
+    async def acquire(self, fail_fast: bool):
+        """Waits until the server may be contacted - or raises CircuitOpenError right away if fail_fast."""
+        while True:
+            state = self.state
+            if state == "closed":
+                return
+            # a probe that never reported back (e.g. cancelled) does not block everybody else forever
+            if state == "half-open" and (not self._probing or time.monotonic() - self._probe_started > self.max_reset_timeout):
+                self._probing = True
+                self._probe_started = time.monotonic()
+                return
+            if fail_fast:
+                raise CircuitOpenError("Server is unreachable - circuit breaker is open")
+            wait = self._timeout - (time.monotonic() - self._opened_at)
+            await asyncio.sleep(max(wait, 0.05))
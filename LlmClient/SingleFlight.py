@@ -0,0 +1,56 @@
+import asyncio
+import os
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests: the first caller of a key runs the work, callers that arrive while
+    it is in flight await the same result (or exception). Nothing is remembered once the work is done - the
+    caches take over from there. Share one instance between clients to coalesce across them - LlmFactory does.
+    """
+
+    def __init__(self):
+        # key -> [task, number of callers waiting for it]
+        self.flights = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def __contains__(self, key) -> bool:
+        return key in self.flights
+
+    async def do(self, key, work):
+        """Returns the result of work() - an async callable - run at most once at a time per key."""
+        flight = self.flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(work())
+            flight = self.flights[key] = [task, 0]
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        flight[1] += 1
+        try:
+            # one caller giving up (cancelled) must not cancel the request for the others
+            return await asyncio.shield(flight[0])
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[0].done():
+                # nobody is waiting any more
+                flight[0].cancel()
+
+    def _done(self, key, task):
+        if self.flights.get(key, [None])[0] is task:
+            del self.flights[key]
+        if not task.cancelled():
+            # retrieved here so an exception nobody waited for is not reported as unhandled
+            task.exception()
+
+    def stats(self):
+        return {"in_flight": len(self.flights), "started": self.started, "coalesced": self.coalesced}
+
+
+def default_single_flight():
+    """A new SingleFlight, or None if LLM_SINGLE_FLIGHT=0 turns coalescing off."""
+    if os.environ.get("LLM_SINGLE_FLIGHT", "1") == "0":
+        return None
+    return SingleFlight()
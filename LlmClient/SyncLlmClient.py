@@ -0,0 +1,135 @@
+import asyncio
+import concurrent.futures
+import threading
+from .LlmLib import LlmFactory, LlmClient
+from .Models import Chat, Embedding
+
+
+class SyncLlmClient:
+    """
+    Blocking facade for synchronous code (Pandas apply, Flask handlers, Spark UDFs):
+        - one event loop runs on a background thread and owns the LlmFactory and its warm sessions
+        - any number of threads may call it at once; their requests are multiplexed over the shared sessions
+        - AskMany returns concurrent.futures.Future objects instead of blocking
+    Create one per process and Close() it when done (or use it as a context manager).
+    """
+
+    def __init__(self, sessions : int = 1, **factory_options):
+        # factory_options are passed to LlmFactory, which is created on the loop thread (gRPC channels belong to their loop)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="LlmClient-loop", daemon=True)
+        self._thread.start()
+        self._next = 0
+        self._closed = False
+        try:
+            self.factory, self.clients = self._run(self._start(sessions, factory_options))
+        except BaseException:
+            self._stop()
+            raise
+
+    async def _start(self, sessions : int, factory_options : dict):
+        factory = LlmFactory(**factory_options)
+        clients = await asyncio.gather(*[factory.create_client() for _ in range(sessions)])
+        return factory, clients
+
+    def _submit(self, coro) -> concurrent.futures.Future:
+        if self._closed:
+            coro.close()
+            raise RuntimeError("SyncLlmClient is closed")
+        if threading.current_thread() is self._thread:
+            # blocking on the loop from inside the loop would deadlock
+            coro.close()
+            raise RuntimeError("SyncLlmClient cannot be called from its own event loop - use LlmClient there")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _run(self, coro, timeout : float = None):
+        future = self._submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def _client(self) -> LlmClient:
+        # only called on the loop thread - no lock needed
+        client = self.clients[self._next % len(self.clients)]
+        self._next += 1
+        return client
+
+    # ----------------------------------------
+    # BLOCKING CALLS
+    # ----------------------------------------
+    def Ask(self, chat : Chat, tags : list[str], cache_only : bool = False, retries: int = -1, timeout : float = None):
+        async def ask():
+            return await self._client().Ask(chat, tags, cache_only=cache_only, retries=retries)
+        return self._run(ask(), timeout)
+
+    def Embed(self, input : Embedding, tags : list[str], cache_only : bool = False, retries: int = -1, as_numpy : bool = False,
+              dtype : str = "float32", timeout : float = None):
+        async def embed():
+            return await self._client().Embed(input, tags, cache_only=cache_only, retries=retries, as_numpy=as_numpy, dtype=dtype)
+        return self._run(embed(), timeout)
+
+    def EmbedBatch(self, texts : list[str], model : str = "text-embedding-3-large_1", tags : list[str] = None, cache_only : bool = False,
+                   retries: int = -1, timeout : float = None, **options):
+        async def embed_batch():
+            return await self._client().EmbedBatch(texts, model, tags, cache_only, retries, **options)
+        return self._run(embed_batch(), timeout)
+
+    # ----------------------------------------
+    # NON-BLOCKING
+    # ----------------------------------------
+    def AskMany(self, chats : list[Chat], tags : list[str], concurrency : int = 32, cache_only : bool = False, retries: int = -1) -> list[concurrent.futures.Future]:
+        """
+        Asks many chats in the background and returns one Future per chat, in input order. Each Future resolves
+        to its LlmSimpleOutput as soon as that chat is answered (cache hits first); use concurrent.futures.as_completed
+        or wait to consume them.
+        """
+        futures = [concurrent.futures.Future() for _ in chats]
+        for future in futures:
+            future.set_running_or_notify_cancel()
+
+        async def drive():
+            try:
+                async for i, output in self._client().AskMany(chats, tags, concurrency, cache_only, retries):
+                    futures[i].set_result(output)
+            except BaseException as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e if isinstance(e, Exception) else concurrent.futures.CancelledError())
+                raise
+
+        self._submit(drive())
+        return futures
+
+    # ----------------------------------------
+    # SHUTDOWN
+    # ----------------------------------------
+    async def _close(self):
+        await asyncio.gather(*[client.Close() for client in self.clients], return_exceptions=True)
+        await self.factory.connection.close()
+        # AskMany drivers that are still running
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _stop(self):
+        self._closed = True
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def Close(self):
+        if self._closed:
+            return
+        try:
+            self._run(self._close())
+        finally:
+            self._stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rmessage.proto\x12\rmessageengine\"/\n\rSimpleMessage\x12\r\n\x05mtype\x18\x01 \x01(\t\x12\x0f\n\x07payload\x18\x02 \x01(\x0c\x32\xd5\x02\n\x08Messages\x12K\n\x0bSendMessage\x12\x1c.messageengine.SimpleMessage\x1a\x1c.messageengine.SimpleMessage\"\x00\x12O\n\rUploadMessage\x12\x1c.messageengine.SimpleMessage\x1a\x1c.messageengine.SimpleMessage\"\x00(\x01\x12Q\n\x0f\x44ownloadMessage\x12\x1c.messageengine.SimpleMessage\x1a\x1c.messageengine.SimpleMessage\"\x00\x30\x01\x12X\n\x14\x42idirectionalMessage\x12\x1c.messageengine.SimpleMessage\x1a\x1c.messageengine.SimpleMessage\"\x00(\x01\x30\x01\x42\x10\xaa\x02\rMessageClientb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rmessage.proto\x12\rmessageengine\"M\n\rSimpleMessage\x12\r\n\x05mtype\x18\x01 \x01(\t\x12\x0f\n\x07payload\x18\x02 \x01(\x0c\x12\n\n\x02id\x18\x03 \x01(\x03\x12\x10\n\x08\x65ncoding\x18\x04 \x01(\t2\xd5\x02\n\x08Messages\x12K\n\x0bSendMessage\x12\x1c.messageengine.SimpleMessage\x1a\x1c.messageengine.SimpleMessage\"\x00\x12O\n\rUploadMessage\x12\x1c.messageengine.SimpleMessage\x1a\x1c.messageengine.SimpleMessage\"\x00(\x01\x12Q\n\x0f\x44ownloadMessage\x12\x1c.messageengine.SimpleMessage\x1a\x1c.messageengine.SimpleMessage\"\x00\x30\x01\x12X\n\x14\x42idirectionalMessage\x12\x1c.messageengine.SimpleMessage\x1a\x1c.messageengine.SimpleMessage\"\x00(\x01\x30\x01\x42\x10\xaa\x02\rMessageClientb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -33,7 +33,7 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['DESCRIPTOR']._loaded_options = None
   _globals['DESCRIPTOR']._serialized_options = b'\252\002\rMessageClient'
   _globals['_SIMPLEMESSAGE']._serialized_start=32
-  _globals['_SIMPLEMESSAGE']._serialized_end=79
-  _globals['_MESSAGES']._serialized_start=82
-  _globals['_MESSAGES']._serialized_end=423
+  _globals['_SIMPLEMESSAGE']._serialized_end=109
+  _globals['_MESSAGES']._serialized_start=112
+  _globals['_MESSAGES']._serialized_end=453
 # @@protoc_insertion_point(module_scope)
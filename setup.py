@@ -6,6 +6,7 @@ setup(
     description='Python library for LLM client',
     url='https://github.com/markusmobius/newsprinceton-llmclient',
     packages=find_packages(),
+    python_requires='>=3.9',
     install_requires=[
         'jsonschema',
         'grpcio',
@@ -13,5 +14,13 @@ setup(
         'protobuf',
         'puremagic',
     ],    
+    extras_require={
+        'numpy': ['numpy'],
+        'zstd': ['zstandard'],
+        'parquet': ['pyarrow'],
+    },
+    entry_points={
+        'console_scripts': ['llmclient-batch=LlmClient.Batch:main'],
+    },
     include_package_data=True
 )
\ No newline at end of file
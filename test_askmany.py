@@ -0,0 +1,43 @@
+import asyncio
+from  LlmClient.LlmLib import LlmFactory
+from LlmClient.Models import Chat
+
+
+async def loop(chats: list[Chat]):
+    factory=LlmFactory()
+    client=await factory.create_client()
+    #results arrive as soon as they are ready - cached ones first
+    async for i,output in client.AskMany(chats,tags=["example"],concurrency=8):
+      print(f"Task {i}")
+      if output.error!=None:
+        print("ERROR:")    
+        print(output.error)
+      else:
+        print("RESPONSE:")    
+        print(output.answer.ChatAnswer)
+      print("________________________________________________________")
+      print("")
+    await client.Close()
+
+
+#define yesno response schema
+yesno_schema={
+  "type": "object",
+  "properties": {
+    "answer": {
+      "type": "string",
+      "enum": ["yes", "no"]
+    }
+  },
+  "required": ["answer"],
+  "additionalProperties": False
+}
+chats=[]
+start=200
+for i in range(30):
+  chat = Chat(responseSchema=yesno_schema) 
+  chat.AddSystemMessage("You are a helpful assistant.")
+  chat.AddUserMessage(f"Is the square root of {start+i} a rational number? Return as JSON.")
+  chats.append(chat)
+
+asyncio.run(loop(chats))
@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+import tempfile
+from LlmClient.LlmCache import open_cache, rekey
+from LlmClient.Models import Chat, Embedding, MessageFragments, json_default
+
+#canonical cache keys vs the keys of older versions (no server needed)
+png=b"\x89PNG\r\n\x1a\n"+bytes(range(256))*64
+path=os.path.join(tempfile.mkdtemp(),"image.png")
+with open(path,"wb") as f:
+    f.write(png)
+
+def make_chat(from_path):
+    chat=Chat(None)
+    chat.AddSystemMessage("You are a helpful assistant.")
+    fragments=MessageFragments()
+    fragments.AddText("What is in this image?")
+    if from_path:
+        fragments.AddImagePath(path)
+    else:
+        fragments.AddImage(png)
+    chat.AddUserMessageList(fragments)
+    return chat
+
+def legacy_key(query):
+    #how older versions keyed the cache: sha256 of the indented request JSON, attachments inline
+    return hashlib.sha256(json.dumps(query, indent=4, default=json_default).encode("utf-8")).hexdigest()
+
+in_memory=make_chat(False)
+from_file=make_chat(True)
+#to_dict() stays plain JSON, attachments as data URLs
+rebuilt=Chat.from_dict(json.loads(json.dumps(in_memory.to_dict())))
+assert in_memory.cache_key()==from_file.cache_key()==rebuilt.cache_key(), "attachments must hash by their bytes, not their form"
+assert legacy_key(in_memory.to_dict())==legacy_key(rebuilt.to_dict())
+#the key ignores key order, the legacy key does not
+reordered=Chat.from_dict(dict(reversed(list(rebuilt.to_dict().items()))))
+assert reordered.cache_key()==rebuilt.cache_key()
+assert legacy_key(reordered.to_dict())!=legacy_key(rebuilt.to_dict())
+#edits through Add* invalidate the memoized key
+before=in_memory.cache_key()
+in_memory.AddAssistantMessage("A test pattern.")
+assert in_memory.cache_key()!=before
+print("canonical keys: ok")
+
+#re-keying a cache written by an older version
+os.environ["LLM_CACHE"]=tempfile.mkdtemp()
+store=open_cache("flat")
+embedding=Embedding("hello")
+entry={"answer": {"ChatAnswer": "a test pattern"}, "error": None}
+store.put(legacy_key(rebuilt.to_dict()), entry)
+store.put(legacy_key(embedding.to_dict()), entry)
+requests=os.path.join(tempfile.mkdtemp(),"requests.jsonl")
+with open(requests,"w",encoding="utf-8") as f:
+    f.write(json.dumps({"id": 1, "chat": from_file.to_dict()}, default=json_default)+"\n")
+    f.write(json.dumps(embedding.to_dict())+"\n")
+    f.write(json.dumps(Embedding("never asked").to_dict())+"\n")
+assert rekey(store, requests)==(2, 0, 1)
+assert store.get(from_file.cache_key())==entry and store.get(embedding.cache_key())==entry
+assert rekey(store, requests)==(0, 2, 1)
+print("rekey: ok")
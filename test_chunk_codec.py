@@ -0,0 +1,136 @@
+import random
+import timeit
+import tracemalloc
+from LlmClient.ChunkWriter import ChunkWriter
+from LlmClient.ChunkReader import ChunkReader
+
+#the codec as it was before the single-buffer rewrite - the wire format must not change
+class LegacyChunkWriter:
+    def __init__(self):
+        self.buffer_list = []
+        self.offset_list = []
+        self.length_list = []
+
+    def write_int(self, num: int):
+        v = num & 0xFFFFFFFF
+        buf = bytearray(10) 
+        offset = 9 
+        length = 0
+        while v >= 0x80:
+            if length == 0:
+                buf[offset] = (v & 0x7F).to_bytes(1, byteorder='big')[0] 
+            else:
+                buf[offset] = ((v & 0x7F) | 0x80).to_bytes(1, byteorder='big')[0]
+            v >>= 7
+            length += 1
+            offset -= 1
+        if length == 0:
+            buf[9] = v.to_bytes(1, byteorder='big')[0] 
+        else:
+            buf[9 - length] = (v | 0x80).to_bytes(1, byteorder='big')[0]
+        length += 1
+        self.buffer_list.append(buf)
+        self.offset_list.append(offset)
+        self.length_list.append(length)
+
+    def write_str(self, val: str):
+        s = val.encode()
+        self.write_int(len(s))
+        self.buffer_list.append(s)
+        self.offset_list.append(0)
+        self.length_list.append(len(s))
+
+    def close(self) -> bytes:
+        total = sum(self.length_list)
+        out = bytearray(total)
+        pos = 0
+        for buf, off, length in zip(self.buffer_list, self.offset_list, self.length_list):
+            out[pos:pos+length] = buf[off:off+length]
+            pos += length
+        return bytes(out)
+
+class LegacyChunkReader:
+    def __init__(self, arr: bytes):
+        self.arr=arr
+        self.offset=0
+
+    def read_int(self):
+        num=0
+        v= self.arr[self.offset]
+        self.offset+=1
+        while v >= 0x80:
+            num = (num << 7) + (v & 0x7F)
+            v = self.arr[self.offset]
+            self.offset+=1
+        num = (num << 7) + v
+        if num>2**31:
+            num=num-2**32
+        return num
+    
+    def read_str(self):
+        len=self.read_int()
+        if len<0:
+            return None
+        val= self.arr[self.offset : (self.offset + len)].decode("utf-8")
+        self.offset+=len
+        return val
+
+
+def write(writer, ints, strs):
+    for i, s in zip(ints, strs):
+        writer.write_int(i)
+        writer.write_str(s)
+    return writer.close()
+
+def read(reader, count):
+    for _ in range(count):
+        reader.read_int()
+        reader.read_str()
+
+
+#byte-for-byte compatibility
+random.seed(1)
+edge=[0,1,-1,127,128,255,16383,16384,2**21,2**28-1,2**31-1,2**31,-2**31,2**32-1,-12345]
+ints=edge+[random.randint(-2**31,2**31-1) for _ in range(20000)]+[random.randint(0,300) for _ in range(20000)]
+strs=["".join(random.choice("abcé€😀 ") for _ in range(random.randint(0,40))) for _ in ints]
+new=write(ChunkWriter(),ints,strs)
+old=write(LegacyChunkWriter(),ints,strs)
+assert new==old, "wire format changed"
+r_new=ChunkReader(new)
+r_old=LegacyChunkReader(new)
+for _ in ints:
+    assert r_new.read_int()==r_old.read_int()
+    assert r_new.read_str()==r_old.read_str()
+writer=ChunkWriter()
+writer.write_str("head")
+writer.write_bytes(b"\x00\xffraw")
+writer.write_int(7)
+reader=ChunkReader(writer.close())
+assert reader.read_str()=="head" and bytes(reader.read_bytes())==b"\x00\xffraw" and reader.read_int()==7
+#fields above the large-field threshold are joined in by close()
+large=["é"*50000, "x"*(1<<20), "small", ""]
+assert write(ChunkWriter(),[1,-1,300,2**31-1],large)==write(LegacyChunkWriter(),[1,-1,300,2**31-1],large)
+writer=ChunkWriter()
+writer.write_bytes(memoryview(bytes(200000)))
+writer.write_str("tail")
+reader=ChunkReader(writer.close())
+assert bytes(reader.read_bytes())==bytes(200000) and reader.read_str()=="tail"
+print(f"compatible: {len(ints)} ints and strings encode to identical {len(new)} bytes")
+
+#micro-benchmark (best of 7 runs)
+big="x"*(20*1024*1024)
+for name,W,R in [("legacy",LegacyChunkWriter,LegacyChunkReader),("current",ChunkWriter,ChunkReader)]:
+    t_small_w=min(timeit.repeat(lambda: write(W(),ints,strs),number=1,repeat=7))
+    t_small_r=min(timeit.repeat(lambda: read(R(new),len(ints)),number=1,repeat=7))
+    def big_write():
+        w=W()
+        w.write_str(big)
+        w.write_int(3)
+        return w.close()
+    t_big=min(timeit.repeat(lambda: R(big_write()).read_str(),number=1,repeat=5))
+    #copies of a large string while writing it: peak allocation / string size
+    tracemalloc.start()
+    big_write()
+    copies=tracemalloc.get_traced_memory()[1]/len(big)
+    tracemalloc.stop()
+    print(f"{name:8s} write 40k fields {t_small_w*1000:7.1f} ms | read 40k fields {t_small_r*1000:7.1f} ms | 20 MB string round trip {t_big*1000:7.1f} ms, {copies:.1f} copies while writing")
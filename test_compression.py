@@ -0,0 +1,52 @@
+import json
+import random
+import time
+from LlmClient.ChunkWriter import ChunkWriter
+from LlmClient.Compression import available_codecs, compress, decompress
+from LlmClient.Models import Chat
+
+#bytes on the wire and CPU cost of the payload codecs for typical messages (no server needed)
+random.seed(1)
+words="the of and to in a is that for it as was with be by on not he this are or his from at which but have an they you were".split()
+def article(n):
+    return " ".join(random.choice(words) for _ in range(n))
+
+schema={"type":"object","properties":{"sentiment":{"type":"string","enum":["positive","neutral","negative"]},"topics":{"type":"array","items":{"type":"string"}},"summary":{"type":"string"}},"required":["sentiment","topics","summary"]}
+instructions="You are a careful news analyst. Read the article and classify its sentiment, list its main topics and write a two sentence summary. "*20
+
+def ask_payload(chat):
+    writer=ChunkWriter()
+    writer.write_str(chat.getJSON())
+    writer.write_str(json.dumps(["bench"]))
+    writer.write_int(0)
+    writer.write_int(-1)
+    return writer.close()
+
+def make_chat():
+    chat=Chat(schema)
+    chat.AddSystemMessage(instructions)
+    chat.AddUserMessage(article(1500))
+    return chat
+
+single=ask_payload(make_chat())
+writer=ChunkWriter()
+writer.write_str(json.dumps([make_chat() for _ in range(500)], default=lambda obj: obj.to_dict(), indent=4))
+writer.write_str(json.dumps(["bench"]))
+writer.write_int(-1)
+bundle=writer.close()
+small=ask_payload(Chat(None))
+
+settings=[(codec,level) for codec in available_codecs() for level in ({"zstd":[1,3,9],"gzip":[1,6]}[codec])]
+for name,payload in [("small ask",small),("single ask",single),("askmany bundle",bundle)]:
+    print(f"{name}: {len(payload):,} bytes uncompressed")
+    for codec,level in settings:
+        runs=max(1,int(2e6//len(payload)))
+        start=time.process_time()
+        for _ in range(runs):
+            packed=compress(codec,payload,level)
+        t_compress=(time.process_time()-start)/runs
+        start=time.process_time()
+        for _ in range(runs):
+            assert decompress(codec,packed)==payload
+        t_decompress=(time.process_time()-start)/runs
+        print(f"   {codec:4s} level {level}: {len(packed):>11,} bytes ({len(packed)/len(payload):6.1%}) | compress {t_compress*1000:8.2f} ms ({len(payload)/t_compress/1e6:6.0f} MB/s) | decompress {t_decompress*1000:7.2f} ms")
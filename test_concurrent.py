@@ -0,0 +1,46 @@
+import asyncio
+from  LlmClient.LlmLib import LlmFactory
+from LlmClient.Models import Chat
+
+
+async def loop(chats: list[Chat]):
+    factory=LlmFactory()
+    #one session carries all requests concurrently
+    client=await factory.create_client()
+    outputs = await asyncio.gather(*[client.Ask(chat,tags=["example"]) for chat in chats])
+    for i,output in enumerate(outputs):
+      print(f"Task {i}")
+      print("chat:")
+      print(chats[i].getJSON())
+      if output.error!=None:
+        print("ERROR:")    
+        print(output.error)
+      else:
+        print("RESPONSE:")    
+        print(output.answer)
+      print("________________________________________________________")
+      print("")
+    await client.Close()
+
+
+#define yesno response schema
+yesno_schema={
+  "type": "object",
+  "properties": {
+    "answer": {
+      "type": "string",
+      "enum": ["yes", "no"]
+    }
+  },
+  "required": ["answer"],
+  "additionalProperties": False
+}
+chats=[]
+start=300
+for i in range(20):
+  chat = Chat(responseSchema=yesno_schema) 
+  chat.AddSystemMessage("You are a helpful assistant.")
+  chat.AddUserMessage(f"Is {start+i} a prime number? Return as JSON.")
+  chats.append(chat)
+
+asyncio.run(loop(chats))
@@ -0,0 +1,25 @@
+import asyncio
+import tempfile
+from  LlmClient.LlmLib import Embedding, LlmFactory
+from LlmClient.EmbeddingIndex import EmbeddingIndex
+
+async def main():
+    factory=LlmFactory()
+    client=await factory.create_client()
+    truefacts=[
+      "Illustra's printing business in three China provinces made record sales.",
+      "Illustra's nuclear power division in mainland Japan saw a 20% decline in sales.",
+      "Illustra's appliance division in Massachusetts introduced a quite nicely successful line of washers."
+    ]
+    recalled=["Illustra introduced some washers","Sales in Japan went down"]
+    #embed the facts into an on-disk index
+    index=EmbeddingIndex(tempfile.mkdtemp())
+    await index.collect(client,[Embedding(fact) for fact in truefacts],tags=["example"])
+    #match every recalled statement to the closest fact
+    queries=[(await client.Embed(Embedding(text),tags=["example"],as_numpy=True)).answer.Embedding for text in recalled]
+    for text,matches in zip(recalled,index.search_texts(queries,k=1)):
+        print(f"{text} -> {matches[0][0]} (cosine {matches[0][1]:.3f})")
+    await client.Close()
+    
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+import numpy as np
+from LlmClient.EmbeddingIndex import EmbeddingIndex
+
+#crash recovery of EmbeddingIndex (no server needed)
+def vectors(n, start=0):
+    return np.arange(start, start+n*4, dtype=np.float32).reshape(n, 4)
+
+def crashed_index(vector_rows, rows_text):
+    #a,b written normally, then an append of c,d cut short after vector_rows vector rows and rows_text of the side table
+    path=tempfile.mkdtemp()
+    index=EmbeddingIndex(path)
+    index.add_many(["a","b"], ["ka","kb"], vectors(2))
+    with open(os.path.join(path,"vectors.f32"),"ab") as f:
+        f.write(vectors(2, 8)[:vector_rows].tobytes())
+    with open(os.path.join(path,"rows.jsonl"),"a",encoding="utf-8") as f:
+        f.write(rows_text)
+    return path
+
+line_c=json.dumps({"text": "c", "key": "kc"})+"\n"
+line_d=json.dumps({"text": "d", "key": "kd"})+"\n"
+cases=[
+    ("partial row after complete rows", 2, line_c+line_d[:7], ["a","b","c"]),
+    ("partial first row", 2, line_d[:7], ["a","b"]),
+    ("row without newline", 2, line_c+line_d[:-1], ["a","b","c"]),
+    ("missing vector rows", 1, line_c+line_d, ["a","b","c"]),
+    ("partial vector row", 0, line_c, ["a","b"]),
+]
+for name, vector_rows, rows_text, expected in cases:
+    path=crashed_index(vector_rows, rows_text)
+    if name=="partial vector row":
+        with open(os.path.join(path,"vectors.f32"),"ab") as f:
+            f.write(b"\0"*6)
+    index=EmbeddingIndex(path)
+    assert index.texts==expected, (name, index.texts)
+    index.add_many(["e","f"], ["ke","kf"], vectors(2, 16))
+    reopened=EmbeddingIndex(path)
+    assert reopened.texts==expected+["e","f"], (name, reopened.texts)
+    assert reopened.matrix.shape==(len(expected)+2, 4), (name, reopened.matrix.shape)
+    assert (reopened.matrix[-2:]==vectors(2, 16)).all(), name
+    assert (reopened.matrix[:2]==vectors(2)).all(), name
+    print(f"{name}: ok")
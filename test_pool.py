@@ -0,0 +1,43 @@
+import asyncio
+from LlmClient.LlmPool import LlmPool
+from LlmClient.Models import Chat
+
+
+async def loop(chats: list[Chat]):
+    #four warm sessions shared by all chats
+    pool=await LlmPool.create(size=4)
+    outputs = await asyncio.gather(*[pool.Ask(chat,tags=["example"]) for chat in chats])
+    for i,output in enumerate(outputs):
+      print(f"Task {i}")
+      if output.error!=None:
+        print("ERROR:")    
+        print(output.error)
+      else:
+        print("RESPONSE:")    
+        print(output.answer.ChatAnswer)
+      print("________________________________________________________")
+      print("")
+    await pool.Close()
+
+
+#define yesno response schema
+yesno_schema={
+  "type": "object",
+  "properties": {
+    "answer": {
+      "type": "string",
+      "enum": ["yes", "no"]
+    }
+  },
+  "required": ["answer"],
+  "additionalProperties": False
+}
+chats=[]
+start=400
+for i in range(40):
+  chat = Chat(responseSchema=yesno_schema) 
+  chat.AddSystemMessage("You are a helpful assistant.")
+  chat.AddUserMessage(f"Is {start+i} divisible by 7? Return as JSON.")
+  chats.append(chat)
+
+asyncio.run(loop(chats))
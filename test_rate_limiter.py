@@ -0,0 +1,122 @@
+import asyncio
+import time
+from LlmClient.LlmOutput import CachedEntry, LlmSimpleOutput, RunMetaData
+from LlmClient.RateLimiter import RateLimiter, ModelLimiter, TokenBucket, estimate_tokens
+
+#token buckets and the adaptive in-flight limit (no server needed)
+def answer(prompt_tokens, completion_tokens):
+    return LlmSimpleOutput(CachedEntry("user", [], "ok", None, RunMetaData("0", 0.0, prompt_tokens, completion_tokens, prompt_tokens+completion_tokens)), None)
+
+def throttled():
+    return LlmSimpleOutput(None, "429 Too Many Requests")
+
+
+async def buckets():
+    #60 per minute = 1 per second, starting full
+    bucket=TokenBucket(60)
+    started=time.monotonic()
+    await bucket.take(60)
+    assert time.monotonic()-started<0.05
+    await bucket.take(0.2)
+    assert 0.15<time.monotonic()-started<0.4
+    #settling an estimate may leave debt that later callers wait out
+    bucket.adjust(0.5)
+    started=time.monotonic()
+    await bucket.take(0.1)
+    assert 0.5<time.monotonic()-started<0.8
+    assert estimate_tokens({"messages": [{"content": "x"*400}]})==101
+    print("token buckets: ok")
+
+asyncio.run(buckets())
+
+
+#additive increase, multiplicative decrease
+limiter=ModelLimiter(initial_concurrency=10)
+limiter.on_success(0.1, 100, 100)
+assert abs(limiter.limit-10.1)<1e-9
+limiter.on_error(True, 0.1)
+assert abs(limiter.limit-5.05)<1e-9
+#one cut per round trip: replies of requests sent before the cut carry no news
+limiter.on_error(True, 0.1)
+assert abs(limiter.limit-5.05)<1e-9
+time.sleep(0.11)
+limiter.on_error(False, 0.1)
+assert abs(limiter.limit-5.05*0.9)<1e-9
+#latency per token well above its baseline counts as congestion
+limiter=ModelLimiter(initial_concurrency=10)
+for _ in range(5):
+    limiter.on_success(0.1, 100, 100)
+before=limiter.limit
+for _ in range(10):
+    limiter.on_success(1.0, 100, 100)
+assert limiter.limit<before
+#the limit stays within its bounds
+limiter=ModelLimiter(initial_concurrency=2, min_concurrency=1, max_concurrency=3)
+for _ in range(100):
+    limiter.on_success(0.1, 10, 10)
+assert limiter.limit==3
+for _ in range(10):
+    limiter._last_decrease=0
+    limiter.on_error(True, 0.1)
+assert limiter.limit==1
+print("AIMD: ok")
+
+
+async def settle():
+    #tokens are reserved from the estimate and settled with the RunMetaData of the reply
+    limiter=RateLimiter(tpm=6000)
+    async with limiter.slot("m", 100) as usage:
+        usage.append(answer(40, 10))
+    bucket=limiter.model("m").tokens
+    assert abs(bucket.level-(6000-50))<2, bucket.level
+    assert limiter.model("m").completion_tokens==1.0
+    #a throttled reply cuts the limit, an exception counts as a failure
+    limiter=RateLimiter(initial_concurrency=8)
+    async with limiter.slot("m", 10) as usage:
+        usage.append(throttled())
+    assert limiter.model("m").limit==4 and limiter.model("m").throttled==1
+    try:
+        async with limiter.slot("other", 10):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert limiter.model("other").limit==8*0.9 and limiter.model("other").in_flight==0
+    print("slot accounting: ok")
+
+asyncio.run(settle())
+
+
+async def simulate(limiter, capacity=20, requests=600):
+    #a server that answers up to capacity requests at once, slows down near it and throttles above it
+    state={"in_flight": 0, "ok": 0, "throttled": 0}
+
+    async def server():
+        state["in_flight"]+=1
+        try:
+            if state["in_flight"]>capacity:
+                await asyncio.sleep(0.002)
+                state["throttled"]+=1
+                return throttled()
+            await asyncio.sleep(0.01*max(1, state["in_flight"]/(capacity*0.7)))
+            state["ok"]+=1
+            return answer(10, 10)
+        finally:
+            state["in_flight"]-=1
+
+    async def request():
+        if limiter is None:
+            return await server()
+        async with limiter.slot("m", 10) as usage:
+            output=await server()
+            usage.append(output)
+        return output
+
+    await asyncio.gather(*[request() for _ in range(requests)])
+    return state
+
+flood=asyncio.run(simulate(None))
+limiter=RateLimiter()
+limited=asyncio.run(simulate(limiter))
+print(f"flood: {flood['ok']}/600 ok, {flood['throttled']} throttled | limited: {limited['ok']}/600 ok, {limited['throttled']} throttled, limit {limiter.stats()['m']['limit']}")
+assert limited["ok"]>=0.95*600 and limited["throttled"]<flood["throttled"]/10
+assert 5<=limiter.stats()["m"]["limit"]<=25
@@ -0,0 +1,107 @@
+import asyncio
+from LlmClient.LlmLib import BidirectionalClient
+from LlmClient.message_pb2 import SimpleMessage
+
+#routing of replies to requests over one session stream (no server needed)
+class FakeCall:
+    #the session's BidirectionalMessage call: writes are recorded, replies are pushed by the test
+    def __init__(self):
+        self.written=[]
+        self.replies=asyncio.Queue()
+
+    async def write(self, message):
+        self.written.append(message)
+
+    def done(self):
+        return False
+
+    def reply(self, payload, id=0):
+        self.replies.put_nowait(SimpleMessage(mtype="ok", payload=payload, id=id))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        msg=await self.replies.get()
+        if msg is None:
+            raise StopAsyncIteration
+        return msg
+
+
+class FakeConnection:
+    stub=None
+
+
+def session(multiplexed):
+    client=BidirectionalClient("llm", FakeConnection())
+    client.call=FakeCall()
+    client.multiplexed=multiplexed
+    client.is_connected=True
+    reader=asyncio.create_task(client._read_call_stream())
+    return client, reader
+
+
+async def multiplexed():
+    client, reader=session(True)
+    #A gives up before its reply arrives
+    try:
+        await asyncio.wait_for(client.send_receive(SimpleMessage(mtype="ask", payload=b"A")), 0.05)
+        raise AssertionError("A was answered")
+    except asyncio.TimeoutError:
+        pass
+    b=asyncio.create_task(client.send_receive(SimpleMessage(mtype="ask", payload=b"B")))
+    await asyncio.sleep(0.01)
+    a_id, b_id=[m.id for m in client.call.written]
+    #A's late reply is dropped, not handed to B
+    client.call.reply(b"answer-for-A", a_id)
+    await asyncio.sleep(0.01)
+    assert not b.done()
+    client.call.reply(b"answer-for-B", b_id)
+    assert (await asyncio.wait_for(b, 1)).payload==b"answer-for-B"
+    #replies arrive in any order
+    c=asyncio.create_task(client.send_receive(SimpleMessage(mtype="ask", payload=b"C")))
+    d=asyncio.create_task(client.send_receive(SimpleMessage(mtype="ask", payload=b"D")))
+    await asyncio.sleep(0.01)
+    c_id, d_id=[m.id for m in client.call.written[2:]]
+    client.call.reply(b"answer-for-D", d_id)
+    client.call.reply(b"answer-for-C", c_id)
+    assert (await c).payload==b"answer-for-C" and (await d).payload==b"answer-for-D"
+    #giving up does not take a multiplexed session down
+    assert client.is_connected and not client._pending
+    #the end of the stream fails whatever is still pending
+    e=asyncio.create_task(client.send_receive(SimpleMessage(mtype="ask", payload=b"E")))
+    await asyncio.sleep(0.01)
+    client.call.replies.put_nowait(None)
+    try:
+        await asyncio.wait_for(e, 1)
+        raise AssertionError("E was answered")
+    except ConnectionError:
+        pass
+    await reader
+    print("multiplexed session: ok")
+
+
+async def in_order():
+    #a server that does not echo ids answers one request at a time, in order
+    client, reader=session(False)
+    a=asyncio.create_task(client.send_receive(SimpleMessage(mtype="ask", payload=b"A")))
+    b=asyncio.create_task(client.send_receive(SimpleMessage(mtype="ask", payload=b"B")))
+    await asyncio.sleep(0.01)
+    assert len(client.call.written)==1
+    client.call.reply(b"answer-for-A")
+    assert (await a).payload==b"answer-for-A"
+    client.call.reply(b"answer-for-B")
+    assert (await b).payload==b"answer-for-B"
+    #once a caller gives up, its late reply cannot be told apart - the session is marked for replacement
+    try:
+        await asyncio.wait_for(client.send_receive(SimpleMessage(mtype="ask", payload=b"C")), 0.05)
+        raise AssertionError("C was answered")
+    except asyncio.TimeoutError:
+        pass
+    assert not client.is_connected
+    client.call.replies.put_nowait(None)
+    await reader
+    print("in-order session: ok")
+
+asyncio.run(multiplexed())
+asyncio.run(in_order())
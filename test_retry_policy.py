@@ -0,0 +1,182 @@
+import asyncio
+import os
+import random
+import time
+from LlmClient.RetryPolicy import RetryPolicy, CircuitBreaker, CircuitOpenError
+
+#backoff, give-up rules and circuit breaker (no server needed)
+random.seed(1)
+
+#full jitter: uniform in [0, min(max_delay, initial * multiplier^(attempt-1))]
+policy=RetryPolicy(initial_delay=0.1, max_delay=2, multiplier=2)
+for attempt in range(1, 12):
+    cap=min(2, 0.1*2**(attempt-1))
+    delays=[policy.delay(attempt) for _ in range(2000)]
+    assert 0<=min(delays) and max(delays)<=cap, (attempt, max(delays), cap)
+    assert max(delays)>cap*0.9 and min(delays)<cap*0.1, "delays must be spread over the whole range"
+print("delay: ok")
+
+#unbounded by default; max_attempts and deadline give up with the cause attached
+for name in ("LLM_RETRY_MAX_ATTEMPTS", "LLM_RETRY_DEADLINE"):
+    os.environ.pop(name, None)
+error=OSError("boom")
+policy=RetryPolicy()
+assert not policy.bounded
+policy.check(10**6, time.monotonic()-10**6, error)
+policy=RetryPolicy(max_attempts=3)
+assert policy.bounded
+policy.check(2, time.monotonic(), error)
+try:
+    policy.check(3, time.monotonic(), error)
+    raise AssertionError("max_attempts not enforced")
+except ConnectionError as e:
+    assert e.__cause__ is error
+policy=RetryPolicy(deadline=5)
+policy.check(100, time.monotonic()-4, error)
+try:
+    policy.check(1, time.monotonic()-5, error)
+    raise AssertionError("deadline not enforced")
+except TimeoutError as e:
+    assert e.__cause__ is error
+os.environ["LLM_RETRY_MAX_ATTEMPTS"]="7"
+assert RetryPolicy().max_attempts==7 and RetryPolicy(max_attempts=2).max_attempts==2
+del os.environ["LLM_RETRY_MAX_ATTEMPTS"]
+print("check: ok")
+
+
+async def breaker():
+    b=CircuitBreaker(failure_threshold=3, reset_timeout=0.05, max_reset_timeout=0.2)
+    for _ in range(2):
+        b.record_failure()
+    assert b.state=="closed"
+    await b.acquire(True)
+    b.record_failure()
+    assert b.state=="open"
+    #fail fast while open, wait otherwise
+    try:
+        await b.acquire(True)
+        raise AssertionError("open circuit let a caller through")
+    except CircuitOpenError:
+        pass
+    started=time.monotonic()
+    await b.acquire(False)
+    assert 0.03<time.monotonic()-started<0.2 and b.state=="half-open"
+    #only one probe at a time
+    try:
+        await b.acquire(True)
+        raise AssertionError("second probe let through")
+    except CircuitOpenError:
+        pass
+    #a failed probe opens the circuit for twice as long
+    b.record_failure()
+    assert b.state=="open" and b._timeout==0.1
+    await asyncio.sleep(0.06)
+    assert b.state=="open"
+    await asyncio.sleep(0.05)
+    assert b.state=="half-open"
+    #backoff is capped
+    for _ in range(5):
+        await b.acquire(False)
+        b.record_failure()
+    assert b._timeout==0.2
+    #a successful probe closes it and resets the timeout
+    await b.acquire(False)
+    b.record_success()
+    assert b.state=="closed" and b._timeout==0.05 and b.failures==0
+    #waiters queue behind the probe and go through once it succeeds
+    for _ in range(3):
+        b.record_failure()
+    await b.acquire(False)
+    waiter=asyncio.create_task(b.acquire(False))
+    await asyncio.sleep(0.1)
+    assert not waiter.done()
+    b.record_success()
+    await asyncio.wait_for(waiter, 1)
+    #a probe that never reports back stops blocking after max_reset_timeout
+    for _ in range(3):
+        b.record_failure()
+    await b.acquire(False)
+    await asyncio.wait_for(b.acquire(False), 1)
+    print("circuit breaker: ok")
+
+asyncio.run(breaker())
+
+
+async def unreachable():
+    #sessions against a closed port give up under a bounded policy and open the shared breaker
+    os.environ["LLM_SERVER_URL"]="127.0.0.1:1"
+    os.environ.setdefault("LLM_USER_CODE","offline")
+    from LlmClient.LlmLib import BidirectionalClient, GrpcConnection
+    connection=GrpcConnection()
+    started=time.monotonic()
+    try:
+        await BidirectionalClient.create("llm", connection, RetryPolicy(initial_delay=0.01, max_delay=0.05, max_attempts=6))
+        raise AssertionError("connected to a closed port")
+    except ConnectionError:
+        pass
+    assert connection.breaker.state!="closed" and connection.connecting==0
+    #with the circuit open, bounded callers fail fast
+    if connection.breaker.state=="open":
+        fast=time.monotonic()
+        try:
+            await BidirectionalClient.create("llm", connection, RetryPolicy(max_attempts=3))
+        except CircuitOpenError:
+            pass
+        assert time.monotonic()-fast<0.1
+    await connection.close()
+    print(f"unreachable server: gave up in {time.monotonic()-started:.2f}s, breaker {connection.breaker.state}")
+
+asyncio.run(unreachable())
+
+
+async def same_session():
+    #only a dead session is replaced - a timeout or a bad reply is retried on it, sparing the other requests
+    import json, tempfile
+    from LlmClient.LlmLib import LlmClient
+    from LlmClient.LlmCache import open_cache
+    from LlmClient.ChunkWriter import ChunkWriter
+    from LlmClient.message_pb2 import SimpleMessage
+
+    def reply(text):
+        writer=ChunkWriter()
+        writer.write_str(text)
+        return SimpleMessage(mtype="reply", payload=writer.close())
+
+    class FakeSession:
+        #answers by mtype from a script of "slow", "bad", "dead" and "ok" steps
+        def __init__(self, script):
+            self.script=script
+            self.is_connected=True
+            self.capabilities=set()
+            self.conn=type("FakeConnection", (), {"attachments": {}})()
+
+        async def send_receive(self, message):
+            step=self.script[message.mtype].pop(0) if self.script[message.mtype] else "ok"
+            if step=="slow":
+                await asyncio.sleep(1)
+            if step=="bad":
+                return reply("not json")
+            if step=="dead":
+                self.is_connected=False
+                raise ConnectionError("call stream closed")
+            await asyncio.sleep(0.02)
+            return reply(json.dumps({"answer": None, "answerReference": None, "error": message.mtype, "isCached": False}))
+
+    client=LlmClient(None, open_cache("flat", tempfile.mkdtemp()), retry_policy=RetryPolicy(initial_delay=0.01, max_delay=0.02, request_timeout=0.1))
+    script={"long": ["slow"], "other": [], "garbled": ["bad", "bad"], "lost": ["dead"]}
+    first=FakeSession(script)
+    client.client=first
+    sessions=[]
+    async def connect():
+        sessions.append(FakeSession(script))
+        client.client=sessions[-1]
+    client.connect=connect
+    outputs=await asyncio.gather(*[client.SendSurely(SimpleMessage(mtype=mtype), True) for mtype in ("long", "other", "garbled")])
+    assert [o.error for o in outputs]==["long", "other", "garbled"]
+    assert client.client is first and not sessions
+    #a dead stream is replaced and the request replayed on the new session
+    output=await client.SendSurely(SimpleMessage(mtype="lost"), True)
+    assert output.error=="lost" and len(sessions)==1 and client.client is sessions[0]
+    print("same session: ok")
+
+asyncio.run(same_session())
@@ -0,0 +1,84 @@
+import asyncio
+import tempfile
+from LlmClient.SingleFlight import SingleFlight
+
+#coalescing of identical concurrent requests (no server needed)
+async def main():
+    flights=SingleFlight()
+    calls=[]
+
+    def work(key, delay=0.05, fail=False):
+        async def run():
+            calls.append(key)
+            await asyncio.sleep(delay)
+            if fail:
+                raise ValueError(key)
+            return f"answer {key}"
+        return run
+
+    #identical keys share one run, different keys do not
+    results=await asyncio.gather(*[flights.do(i%3, work(i%3)) for i in range(30)])
+    assert results==[f"answer {i%3}" for i in range(30)] and sorted(calls)==[0,1,2]
+    assert flights.stats()=={"in_flight": 0, "started": 3, "coalesced": 27}
+    #nothing is remembered once the flight has landed
+    calls.clear()
+    await flights.do(0, work(0))
+    assert calls==[0]
+
+    #every waiter gets the exception
+    results=await asyncio.gather(*[flights.do("bad", work("bad", fail=True)) for _ in range(5)], return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+    #the first caller giving up does not cancel the request for the others
+    calls.clear()
+    leader=asyncio.create_task(flights.do("k", work("k", 0.1)))
+    await asyncio.sleep(0.01)
+    follower=asyncio.create_task(flights.do("k", work("k", 0.1)))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert await follower=="answer k" and calls==["k"]
+    assert leader.cancelled()
+
+    #once nobody waits any more, the request is cancelled and forgotten
+    cancelled=asyncio.Event()
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    waiters=[asyncio.create_task(flights.do("slow", slow)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.wait_for(cancelled.wait(), 1)
+    await asyncio.sleep(0)
+    assert "slow" not in flights
+    print("single flight: ok", flights.stats())
+
+asyncio.run(main())
+
+
+#the same through LlmClient.coalesce, shared by two clients the way LlmFactory shares it
+async def clients():
+    from LlmClient.LlmLib import LlmClient
+    from LlmClient.LlmCache import open_cache
+    #clients are not connected - only their coalescing is used
+    shared=SingleFlight()
+    cache=open_cache("flat", tempfile.mkdtemp())
+    a=LlmClient(None, cache, single_flight=shared)
+    b=LlmClient(None, cache, single_flight=shared)
+    sent=[]
+    async def send():
+        sent.append(1)
+        await asyncio.sleep(0.02)
+        return "answer"
+    results=await asyncio.gather(*[(a if i%2 else b).coalesce(("key", False), send) for i in range(10)])
+    assert results==["answer"]*10 and len(sent)==1
+    #a different cache_only flag is a different request
+    await asyncio.gather(a.coalesce(("key", False), send), b.coalesce(("key", True), send))
+    assert len(sent)==3
+    print("coalescing across clients: ok")
+
+asyncio.run(clients())
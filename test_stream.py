@@ -0,0 +1,34 @@
+import asyncio
+import time
+from  LlmClient.LlmLib import LlmFactory
+from LlmClient.Models import Chat
+
+
+async def loop(chat: Chat):
+    factory=LlmFactory()
+    client=await factory.create_client()
+    start=time.perf_counter()
+    first=None
+    #text arrives while it is generated - the last item is the complete LlmSimpleOutput
+    async for item in client.AskStream(chat,tags=["example"]):
+      if isinstance(item,str):
+        if first is None:
+          first=time.perf_counter()-start
+        print(item,end="",flush=True)
+      else:
+        print("")
+        print("________________________________________________________")
+        if item.error!=None:
+          print("ERROR:")    
+          print(item.error)
+        else:
+          print(item.answer.RuntimeData)
+    print(f"time to first token {first:.2f}s, total {time.perf_counter()-start:.2f}s")
+    await client.Close()
+
+
+chat = Chat(responseSchema=None) 
+chat.AddSystemMessage("You are a helpful assistant.")
+chat.AddUserMessage("Explain in three paragraphs why the square root of 2 is irrational.")
+
+asyncio.run(loop(chat))
@@ -0,0 +1,42 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from LlmClient.SyncLlmClient import SyncLlmClient
+from LlmClient.Models import Chat
+
+
+def make_chat(n):
+  chat = Chat(responseSchema=yesno_schema) 
+  chat.AddSystemMessage("You are a helpful assistant.")
+  chat.AddUserMessage(f"Is {n} divisible by 7? Return as JSON.")
+  return chat
+
+#define yesno response schema
+yesno_schema={
+  "type": "object",
+  "properties": {
+    "answer": {
+      "type": "string",
+      "enum": ["yes", "no"]
+    }
+  },
+  "required": ["answer"],
+  "additionalProperties": False
+}
+
+#one background event loop and session for the whole process - no asyncio in the calling code
+with SyncLlmClient() as client:
+  #blocking calls from many threads share the warm session
+  start=time.perf_counter()
+  with ThreadPoolExecutor(16) as executor:
+    outputs=list(executor.map(lambda n: client.Ask(make_chat(n),tags=["example"]), range(400,440)))
+  print(f"{sum(o.error is None for o in outputs)} answers from 16 threads in {time.perf_counter()-start:.2f}s")
+
+  #AskMany returns futures right away
+  futures=client.AskMany([make_chat(n) for n in range(500,540)],tags=["example"])
+  for future in as_completed(futures):
+    output=future.result()
+    if output.error!=None:
+      print("ERROR:")    
+      print(output.error)
+    else:
+      print(output.answer.ChatAnswer)